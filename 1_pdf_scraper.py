@@ -3,35 +3,106 @@ import re
 import fitz
 import json
 from pathlib import Path
+from multiprocessing import Pool
 from unidecode import unidecode
 
-def extract_text_by_page(pdf_path: str):
+OUTPUT_DIR = "./data/extracted_pdfs"
+# Pages handed to a worker per task; bounds memory held per in-flight task
+PAGES_PER_TASK = 32
+
+# Control characters are deleted and double quotes mapped to single quotes in one translate pass
+_CLEAN_TABLE = {c: None for c in range(0x20)}
+_CLEAN_TABLE[0x7F] = None
+_CLEAN_TABLE[ord('"')] = "'"
+_DOT_LEADER_RE = re.compile(r'\.{5,}\s*\d*')
+
+# The document this worker is reading; tasks of one PDF arrive together, so only one is kept open
+_open_doc = None
+
+
+def clean_page_text(text: str) -> str:
+    """
+        Normalizes raw page text: ASCII transliteration, control characters removed,
+        escape sequences decoded, table-of-contents dot leaders dropped, whitespace collapsed.
     """
-        Extracts text page by page from a PDF.
-        Returns: list of {"page": int, "text": str}
+    text = unidecode(text).translate(_CLEAN_TABLE)
+    if "\\" in text:
+        text = text.encode().decode("unicode_escape").replace('"', "'")
+    if "....." in text:
+        text = _DOT_LEADER_RE.sub('', text)
+    return ' '.join(text.split())
+
+
+def extract_page_range(task):
+    """
+        Worker: extracts and cleans pages [start, stop) of one PDF.
+        The document stays open across consecutive tasks of the same PDF and is
+        closed when the worker moves on to the next one.
     """
-    doc = fitz.open(pdf_path)
-    pages = []
-    for i, page in enumerate(doc):
-        text = page.get_text("text")
-        text = unidecode(text)
-        text = re.sub(r'[\u0000-\u001F\u007F]', '', text)
-        text = text.encode().decode("unicode_escape")
-        text = text.replace('\"', '\'')
-        text = re.sub(r'\.{5,}\s*\d*', '', text)
-        text = re.sub(r'\s+', ' ', text).strip()
-        cleaned_text = ' '.join(text.split())
-        pages.append({"page": i + 1, "text": cleaned_text, "source": Path(pdf_path).name})
-    doc.close()
-
-    os.makedirs("./data/extracted_pdfs", exist_ok=True)
-    with open(f"./data/extracted_pdfs/{Path(pdf_path).stem}_extracted.json", "w", encoding="utf-16") as f:
-        json.dump(pages, f, indent=4)
-    return pages
-
-
-files = os.listdir("./data/raw_pdfs")
-pdf_files = [f for f in files if f.endswith(".pdf")]
-
-for pdf_file in pdf_files:
-    extract_text_by_page(os.path.join("./data/raw_pdfs", pdf_file))
\ No newline at end of file
+    global _open_doc
+    pdf_path, start, stop = task
+    if _open_doc is None or _open_doc.name != pdf_path:
+        if _open_doc is not None:
+            _open_doc.close()
+        _open_doc = fitz.open(pdf_path)
+    doc = _open_doc
+    source = Path(pdf_path).name
+    return pdf_path, [
+        {"page": i + 1, "text": clean_page_text(doc[i].get_text("text")), "source": source}
+        for i in range(start, stop)
+    ]
+
+
+def page_tasks(pdf_paths):
+    for pdf_path in pdf_paths:
+        with fitz.open(pdf_path) as doc:
+            page_count = doc.page_count
+        for start in range(0, page_count, PAGES_PER_TASK):
+            yield pdf_path, start, min(start + PAGES_PER_TASK, page_count)
+
+
+def _finish_output(out_f):
+    out_f.close()
+    os.replace(out_f.name, out_f.name[:-len(".tmp")])
+
+
+def extract_text_by_page(pdf_paths, processes=None):
+    """
+        Extracts text page by page from PDFs across a process pool.
+        Pages are written incrementally, in order, to one JSON Lines file per PDF
+        ({"page": int, "text": str, "source": str} per line), so memory stays
+        constant regardless of document size.
+        Returns: {pdf_path: number of pages written}
+    """
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    written = {}
+    out_f, current = None, None
+    try:
+        with Pool(processes=processes) as pool:
+            for pdf_path, pages in pool.imap(extract_page_range, page_tasks(pdf_paths)):
+                if pdf_path != current:
+                    if out_f:
+                        _finish_output(out_f)
+                        out_f = None
+                    current = pdf_path
+                    out_f = open(os.path.join(OUTPUT_DIR, f"{Path(pdf_path).stem}_extracted.jsonl.tmp"), "w", encoding="utf-8")
+                for page in pages:
+                    out_f.write(json.dumps(page, ensure_ascii=False) + "\n")
+                written[pdf_path] = written.get(pdf_path, 0) + len(pages)
+        if out_f:
+            _finish_output(out_f)
+            out_f = None
+    finally:
+        # A worker error leaves the current file unfinished; don't leave its .tmp behind
+        if out_f:
+            out_f.close()
+            os.remove(out_f.name)
+    return written
+
+
+if __name__ == "__main__":
+    files = os.listdir("./data/raw_pdfs")
+    pdf_files = [os.path.join("./data/raw_pdfs", f) for f in files if f.endswith(".pdf")]
+
+    for pdf_file, page_count in extract_text_by_page(pdf_files).items():
+        print(f"✅ Extracted {page_count} pages from {pdf_file}")
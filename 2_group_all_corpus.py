@@ -1,14 +1,31 @@
 import os
 import json
+from raptor_artifacts import ArtifactStore
 
 
+def read_pages(path):
+    """Yields extracted pages from a JSON Lines file, or from a legacy UTF-16 JSON list."""
+    if path.endswith(".jsonl"):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                yield json.loads(line)
+    else:
+        with open(path, "r", encoding="utf-16") as f:
+            yield from json.load(f)
+
+
+# Prefer the streaming .jsonl output over a legacy .json of the same document
+extracted = {}
+for i in sorted(os.listdir("./data/extracted_pdfs")):
+    stem, ext = os.path.splitext(i)
+    if ext == ".jsonl" or (ext == ".json" and stem not in extracted):
+        extracted[stem] = i
+
 all_chunks = []
-for i in os.listdir("./data/extracted_pdfs"):
-    with open(os.path.join("./data/extracted_pdfs", i), "r", encoding="utf-16") as f:
-        corpus = json.load(f)
-        all_text = ' '.join([j['text'] for j in corpus])
-        all_chunks.append({"text": all_text, "source": i.replace(".json",".pdf")})
-
-os.makedirs("./essentials", exist_ok=True)
-with open("./essentials/group_chunks.json", "w", encoding="utf-16") as f:
-    json.dump(all_chunks, f, ensure_ascii=False, indent=4)
\ No newline at end of file
+for stem, i in extracted.items():
+    all_text = ' '.join(page['text'] for page in read_pages(os.path.join("./data/extracted_pdfs", i)))
+    all_chunks.append({"text": all_text, "source": stem + ".pdf"})
+
+store = ArtifactStore()
+store.save_documents(all_chunks)
+store.close()
@@ -1,5 +1,6 @@
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-import json
+from raptor_artifacts import ArtifactStore
+from lexical_index import BM25Index
 
 text_splitter = RecursiveCharacterTextSplitter(
     chunk_size=1000,
@@ -20,12 +21,18 @@ def create_chunks(corpus, file_id):
     return chunks
 
 
-with open("./essentials/group_chunks.json", "r", encoding="utf-16") as f:
-    doc_corpus = json.loads(f.read())
-    chunk_generator = {}
-    for file_id, file_content in enumerate(doc_corpus):
-        chunks = create_chunks(file_content, file_id)
-        chunk_generator[f"file_{file_id}"] = {"levels": {"level_0": chunks}, "source": file_content["source"]}
+store = ArtifactStore()
+chunk_generator = {}
+for file_id, file_content in enumerate(store.iter_documents()):
+    chunks = create_chunks(file_content, file_id)
+    chunk_generator[f"file_{file_id}"] = {"levels": {"level_0": chunks}, "source": file_content["source"]}
 
-    with open("./essentials/summary_tree.json", "w", encoding="utf-16") as out_f:
-        json.dump(chunk_generator, out_f, ensure_ascii=False, indent=4)
\ No newline at end of file
+store.save_tree(chunk_generator)
+
+# BM25 index over the level-0 chunks, for exact identifiers (device names, error codes) that embeddings blur
+lexical_index = BM25Index.build(
+    (chunk["id"], chunk["text"]) for file_data in chunk_generator.values() for chunk in file_data["levels"]["level_0"]
+)
+lexical_index.save(store)
+print(f"✅ Indexed {len(lexical_index)} chunks for lexical search")
+store.close()
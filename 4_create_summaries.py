@@ -1,17 +1,38 @@
+import os
 import json
-from langchain_ollama import ChatOllama
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from langchain_ollama import ChatOllama, OllamaEmbeddings
 from langchain.prompts import PromptTemplate
 from langchain.chains import LLMChain
+from summary_cache import SummaryCache
+from embedding_cache import EmbeddingCache, CachedEmbedder
+from semantic_clustering import cluster_indices
+from raptor_artifacts import ArtifactStore
 import warnings
 warnings.filterwarnings("ignore")
 
-
-def create_summaries(batch, level):
-    llm = ChatOllama(model="llama3", temperature=0)
-
-    summary_prompt = PromptTemplate(
-        input_variables=["text", "level"],
-        template="""
+CHECKPOINT_PATH = "essentials/summary_checkpoint.jsonl"
+SUMMARY_MODEL = "llama3"
+BATCH_SIZE = 5
+# "positional": contiguous BATCH_SIZE slices; "semantic": clusters of similar nodes by embedding
+GROUPING = "positional"
+# Semantic mode: clusters average BATCH_SIZE nodes and never exceed CLUSTER_MAX_SIZE,
+# so a cluster of level-0 chunks (<= 1000 characters each) still fits the summary prompt
+CLUSTER_MAX_SIZE = 8
+CLUSTER_DIMENSIONS = 32
+# Same model and cache as 5_embedding.py, so vectors computed here are reused there
+EMBED_MODEL = "nomic-embed-text"
+# Batches of a level are independent; keep this in line with OLLAMA_NUM_PARALLEL
+MAX_WORKERS = 4
+
+# One client and chain shared by every batch
+llm = ChatOllama(model=SUMMARY_MODEL, temperature=0)
+
+summary_prompt = PromptTemplate(
+    input_variables=["text", "level"],
+    template="""
             You are an expert scientific summarizer for a retrieval-augmented generation (RAG) system.  
             Your task is to create a **concise but information-rich summary** of the following text.  
             The summary will later be used recursively to build a hierarchical knowledge tree (RAPTOR), so it must be coherent, self-contained, and faithful.
@@ -36,54 +57,148 @@ def create_summaries(batch, level):
             ### Input text (level {level}):
             <<<{text}>>>
         """
-    )
+)
+summary_chain = LLMChain(llm=llm, prompt=summary_prompt)
+summary_cache = SummaryCache()
+
 
-    text = "\n\n".join([chunk["text"] for chunk in batch])
-    summary_chain = LLMChain(llm=llm, prompt=summary_prompt)
+def create_summaries(batch, level):
+    texts = [chunk["text"] for chunk in batch]
+    cache_key = SummaryCache.key(texts, level, SUMMARY_MODEL, summary_prompt.template)
+    cached = summary_cache.get(cache_key)
+    if cached is not None:
+        return {"summary": cached}
+
+    text = "\n\n".join(texts)
     response = summary_chain.run(text=text, level=level)
     summary = json.loads(response[response.find('{'):response.rfind('}')+1])
+    summary_cache.put(cache_key, summary["summary"], level)
     return summary
 
 
-with open('essentials/summary_tree.json', 'r', encoding="utf-16") as f:
-    summary_tree = json.load(f)
+_embedder = None
+
+
+def level_embeddings(chunks):
+    global _embedder
+    if _embedder is None:
+        _embedder = CachedEmbedder(OllamaEmbeddings(model=EMBED_MODEL), EmbeddingCache(EMBED_MODEL))
+    return _embedder.embed_documents([chunk["text"] for chunk in chunks])
+
+
+def group_level(current_level):
+    """Split a level into the groups that each become one summary at the next level."""
+    if GROUPING == "semantic":
+        clusters = cluster_indices(level_embeddings(current_level), BATCH_SIZE, CLUSTER_MAX_SIZE, CLUSTER_DIMENSIONS)
+        return [[current_level[i] for i in cluster] for cluster in clusters]
+    return [current_level[i:i + BATCH_SIZE] for i in range(0, len(current_level), BATCH_SIZE)]
+
+
+def load_checkpoint():
+    """
+    Load summaries completed by a previous (possibly interrupted) run.
+    Returns: {summary_id: node}
+    """
+    done = {}
+    if not os.path.exists(CHECKPOINT_PATH):
+        return done
+    with open(CHECKPOINT_PATH, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                node = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # partially written last line from a crash
+            done[node["id"]] = node
+    return done
+
+
+_checkpoint_lock = threading.Lock()
+
+
+def source_hash(batch):
+    """Digest of the child texts, so a checkpointed summary is redone when its chunks were edited."""
+    digest = hashlib.sha256()
+    for chunk in batch:
+        digest.update(chunk["text"].encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def save_checkpoint(node):
+    """Append one finished summary so a restart can skip it."""
+    with _checkpoint_lock:
+        with open(CHECKPOINT_PATH, "a", encoding="utf-8") as f:
+            f.write(json.dumps(node, ensure_ascii=False) + "\n")
+            f.flush()
+
+
+def summarize_level(file, current_level, next_level_num, checkpoint, executor):
+    """
+    Summarize all batches of a level concurrently.
+    Batches already present in the checkpoint are reused instead of re-sent to the LLM.
+    """
+    batches = group_level(current_level)
+
+    def summarize_batch(batch_num, batch):
+        summary_id = f"{file}_summary_{batch_num}_level_{next_level_num}"
+        source = [chunk["id"] for chunk in batch]
+        digest = source_hash(batch)
+
+        done = checkpoint.get(summary_id)
+        if done and done["source"] == source and done.get("source_hash") == digest:
+            print(f"\t\t↩️ Resumed batch {batch_num} ({len(batch)} chunks) -> Summary ID: {summary_id}")
+            return {key: done[key] for key in ("id", "text", "source")}
+
+        summary = create_summaries(batch, next_level_num)
+        node = {
+            "id": summary_id,
+            "text": summary["summary"],
+            "source": source
+        }
+        save_checkpoint(dict(node, source_hash=digest))
+        print(f"\t\t🔹Summarized batch {batch_num} ({len(batch)} chunks) -> Summary ID: {summary_id}")
+        return node
+
+    return list(executor.map(summarize_batch, range(len(batches)), batches))
+
 
-for file in summary_tree.keys():
-    print(f"Processing {file}...")
+store = ArtifactStore()
 
-    summary_levels = summary_tree[file]["levels"]
-    max_level = list(summary_levels.keys())[-1]
+checkpoint = load_checkpoint()
+if checkpoint:
+    print(f"Resuming with {len(checkpoint)} checkpointed summaries.")
 
-    while len(summary_levels[max_level]) > 1:
-        print("Current Level:", max_level)
-        print("Number of chunks at this level:", len(summary_levels[max_level]))
+with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+    for file in store.file_ids():
+        print(f"Processing {file}...")
 
-        current_level = summary_levels[max_level]
-        next_level = []
-        next_level_num = int(max_level.split('_')[1]) + 1
-        next_name = f"level_{next_level_num}"
-        batch_size = 5
+        summary_levels = store.load_file(file)["levels"]
+        max_level = list(summary_levels.keys())[-1]
 
-        print(f"\t🟠 Starting Level: {next_name}...")
+        while len(summary_levels[max_level]) > 1:
+            print("Current Level:", max_level)
+            print("Number of chunks at this level:", len(summary_levels[max_level]))
 
-        for i in range(0, len(current_level), batch_size):
-            batch = current_level[i:i + batch_size]
-            summary = create_summaries(batch, next_level_num)
-            next_level.append({
-                "id": f"{file}_summary_{i//5}_level_{next_level_num}",
-                "text": summary["summary"],
-                "source": [chunk["id"] for chunk in batch]
-            })
+            current_level = summary_levels[max_level]
+            next_level_num = int(max_level.split('_')[1]) + 1
+            next_name = f"level_{next_level_num}"
 
-            print(f"\t\t🔹Summarized batch {i}-{i+4} -> Summary ID: {file}_summary_{i//5}_level_{next_level_num}")
+            print(f"\t🟠 Starting Level: {next_name}...")
 
-        summary_levels[next_name] = next_level
-        summary_tree[file]["levels"] = summary_levels
-        max_level = next_name
+            next_level = summarize_level(file, current_level, next_level_num, checkpoint, executor)
+
+            summary_levels[next_name] = next_level
+            store.put_level(file, next_level_num, next_level)
+            max_level = next_name
 
-        print(f"\t🟢 Completed Level {next_level_num}; Total Chunks: {len(next_level)}")
+            print(f"\t🟢 Completed Level {next_level_num}; Total Chunks: {len(next_level)}")
 
-    print(f"✅ Finished processing {file}.\n")
+        print(f"✅ Finished processing {file}.\n")
+
+# The tree on disk is complete, so the checkpoint is no longer needed
+if os.path.exists(CHECKPOINT_PATH):
+    os.remove(CHECKPOINT_PATH)
 
-    with open('essentials/summary_tree.json', 'w', encoding="utf-16") as out_f:
-        json.dump(summary_tree, out_f, ensure_ascii=False, indent=4)
\ No newline at end of file
+print(summary_cache.report())
+summary_cache.close()
+store.close()
@@ -1,42 +1,78 @@
 import json
+import hashlib
 from langchain_ollama import OllamaEmbeddings
-from langchain_community.vectorstores import Chroma
+from embedding_cache import EmbeddingCache, CachedEmbedder
+from raptor_artifacts import ArtifactStore
+from vector_backends import open_backend
 
-# Load summary tree
-with open("./essentials/summary_tree.json", "r", encoding="utf-16") as f:
-    data = json.load(f)
+EMBED_MODEL = "nomic-embed-text"
+# Number of texts sent to the embedder per call, and how many calls run at once
+EMBED_BATCH_SIZE = 64
+EMBED_WORKERS = 4
 
-# Flatten chunks + summaries into docs
+
+def content_hash(text, metadata):
+    """Digest of a node's text and the metadata stored with it; a change in either re-upserts the node."""
+    return hashlib.sha256(json.dumps([text, metadata], sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+# Flatten chunks + summaries of the summary tree into docs
+store = ArtifactStore()
 docs = []
-for file_id, file_data in data.items():
-    for level_name, chunks in file_data["levels"].items():
-        level_num = int(level_name.split("_")[1])
-        for chunk in chunks:
-            docs.append({
-                "id": chunk["id"],
-                "text": chunk["text"],
-                "metadata": {
-                    "id": chunk["id"],          # needed for filtering later
-                    "file_id": file_id,
-                    "level": level_num,
-                    "chunk_source": json.dumps(chunk.get("source", []))
-                }
-            })
-
-# Prepare texts and metadatas
-texts = [d["text"] for d in docs]
-metadatas = [d["metadata"] for d in docs]
-
-# Embeddings
-embeddings = OllamaEmbeddings(model="nomic-embed-text")
-
-# Initialize Chroma vectorstore (persistent)
-vectorstore = Chroma.from_texts(
-    texts=texts,
-    embedding=embeddings,
-    metadatas=metadatas,
-    persist_directory="./chroma_store"  # where data will be saved
+for file_id, level_num, chunk in store.iter_nodes():
+    metadata = {
+        "id": chunk["id"],          # needed for filtering later
+        "file_id": file_id,
+        "level": level_num,
+        "chunk_source": json.dumps(chunk.get("source", []))
+    }
+    metadata["content_hash"] = content_hash(chunk["text"], metadata)
+    docs.append({"id": chunk["id"], "text": chunk["text"], "metadata": metadata})
+store.close()
+
+# Embeddings, served from the on-disk cache where possible
+embeddings = CachedEmbedder(
+    OllamaEmbeddings(model=EMBED_MODEL),
+    EmbeddingCache(EMBED_MODEL),
+    batch_size=EMBED_BATCH_SIZE,
+    max_workers=EMBED_WORKERS
 )
 
+# Open the configured vector backend (Chroma or the memory-mapped index) and diff it against the tree
+vectorstore = open_backend(embeddings)
+
+stored = vectorstore.get(include=["metadatas"])
+stored_hashes = {}
+stale_ids = []
+for store_id, metadata in zip(stored["ids"], stored["metadatas"]):
+    node_id = metadata.get("id")
+    # Older builds used random ids and could hold duplicates; keep one entry per node, keyed by its id
+    if store_id != node_id or node_id in stored_hashes:
+        stale_ids.append(store_id)
+        continue
+    stored_hashes[node_id] = metadata.get("content_hash")
+
+tree_ids = {d["id"] for d in docs}
+stale_ids.extend(node_id for node_id in stored_hashes if node_id not in tree_ids)
+changed = [d for d in docs if stored_hashes.get(d["id"]) != d["metadata"]["content_hash"]]
+
+print(f"🔎 {len(docs)} nodes in tree: {len(changed)} new or changed, {len(stale_ids)} stale entries to delete")
+
+if stale_ids:
+    vectorstore.delete(ids=stale_ids)
+
+# Embed all new/changed nodes concurrently up front; the upserts below then read from the cache
+embeddings.embed_documents([d["text"] for d in changed])
+
+# Upsert only new/changed nodes
+for i in range(0, len(changed), EMBED_BATCH_SIZE):
+    batch = changed[i:i + EMBED_BATCH_SIZE]
+    vectorstore.upsert(
+        ids=[d["id"] for d in batch],
+        texts=[d["text"] for d in batch],
+        metadatas=[d["metadata"] for d in batch]
+    )
+    print(f"\t🔹Upserted {i + len(batch)}/{len(changed)}")
+
 vectorstore.persist()  # ensure it’s saved to disk
-print("✅ Chroma index built and saved to ./chroma_store")
+print(f"✅ {vectorstore.name} index updated and saved")
@@ -1,10 +1,13 @@
-from r6_retrieval_mechs import raptor_retrieve
-import ollama
+from r6_retrieval_mechs import raptor_retrieve, collapsed_retrieve, hybrid_retrieve, warm_up, embed_query, context_fingerprint, fingerprint_is_current
+from answer_cache import SemanticAnswerCache
+from query_history import QueryHistory
+from context_packer import pack_context
+from query_metrics import metrics
 import logging
+import threading
 import time
 from datetime import datetime
-from typing import List, Optional
-import json
+from typing import Iterator, List, Optional, Tuple
 
 # Configure logging
 logging.basicConfig(
@@ -24,35 +27,73 @@ CONFIG = {
     "top_p": 0.9,
     "top_k": 40,
     "repeat_penalty": 1.1,
-    "max_context_length": 8000,
+    "max_context_tokens": 2000,
     "default_top_k_root": 2,
-    "default_top_k_children": 3
+    "default_top_k_children": 3,
+    "retrieval_mode": "tree",  # "tree" (top-down descent), "collapsed" (top-k over all levels) or "hybrid" (tree + BM25)
+    "collapsed_top_k": 10,
+    "collapsed_level_weights": None,  # e.g. {0: 1.0, 1: 0.9, 2: 0.8}
+    "lexical_top_k": 10,  # hybrid mode: BM25 hits fused with the tree results
+    "rrf_k": 60,  # hybrid mode: reciprocal rank fusion constant
+    "answer_cache_threshold": 0.95,
+    "answer_cache_size": 512,
+    "answer_cache_ttl": 3600,
+    "metrics_enabled": False,  # span timers and counters; near-free when off
+    "slow_query_seconds": 10.0,  # log the per-stage breakdown of queries slower than this
+    "metrics_json_path": "query_metrics.json"
 }
 
+# Append-only history, opened on first use; the old query_history.json is imported then
+_history = None
+_history_lock = threading.Lock()
 
-def validate_context_length(context_text: str, max_length: int = CONFIG["max_context_length"]) -> str:
-    """Validate and truncate context if too long."""
-    if len(context_text) <= max_length:
-        return context_text
-    
-    logger.warning(f"Context length ({len(context_text)}) exceeds maximum ({max_length}). Truncating...")
-    return context_text[:max_length] + "\n\n[Context truncated due to length limits...]"
+if CONFIG["metrics_enabled"]:
+    metrics.enable(slow_query_seconds=CONFIG["slow_query_seconds"])
 
+# Near-duplicate questions are answered from here instead of re-running retrieval and generation
+answer_cache = SemanticAnswerCache(
+    threshold=CONFIG["answer_cache_threshold"],
+    max_entries=CONFIG["answer_cache_size"],
+    ttl=CONFIG["answer_cache_ttl"]
+)
 
-def answer_llm(question: str, context: List, show_sources: bool = True) -> str:
-    """Generate an answer using hierarchical RAPTOR RAG context and LLM."""
-    start_time = time.time()
-    
-    if not context:
-        logger.warning(f"No context found for question: {question[:100]}...")
-        return "❌ No relevant context found for your question."
+
+def get_history() -> QueryHistory:
+    global _history
+    if _history is None:
+        with _history_lock:
+            if _history is None:
+                _history = QueryHistory("query_history.sqlite3", legacy_json_path="query_history.json")
+    return _history
+
+
+def ollama_chat(**kwargs):
+    import ollama  # deferred so importing this module stays fast
+    return ollama.chat(**kwargs)
+
+
+# Chat function used by answer_llm; swap for local_backends.StubChat to run without Ollama
+chat_backend = ollama_chat
+
+
+def build_prompt(question: str, context: List):
+    """Format the retrieved context and build the LLM prompt. Returns (prompt, sources)."""
+    # Pack the best-scoring chunks into the token budget, trimming splitter overlap between neighbours
+    def chunk_header(doc):
+        return f"[Chunk: {doc.metadata.get('id', 'Unknown chunk')}]\n\n\n"
+
+    packed, pack_stats = pack_context(context, CONFIG["max_context_tokens"], header=chunk_header)
+    metrics.observe("context_chunks", len(packed))
+    metrics.observe("context_tokens", pack_stats["tokens"])
+    if pack_stats["dropped"]:
+        logger.warning(f"Context budget ({pack_stats['budget']} tokens) reached; "
+                       f"dropped {pack_stats['dropped']} lowest-ranked chunks")
     
     # Format context with source information
     formatted_context = []
     sources = set()
     
-    for doc in context:
-        content = doc.page_content
+    for doc, content in packed:
         source = doc.metadata.get('source', 'Unknown source')
         chunk_id = doc.metadata.get('id', 'Unknown chunk')
         
@@ -60,9 +101,9 @@ def answer_llm(question: str, context: List, show_sources: bool = True) -> str:
         formatted_context.append(f"[Chunk: {chunk_id}]\n{content}")
     
     context_text = "\n\n".join(formatted_context)
-    context_text = validate_context_length(context_text)
     
-    logger.info(f"Processing question with {len(context)} chunks from {len(sources)} sources")
+    logger.info(f"Processing question with {len(packed)}/{len(context)} chunks ({pack_stats['tokens']} tokens) "
+                f"from {len(sources)} sources")
 
     prompt = f"""You are an expert biomedical assistant with access to a hierarchical knowledge retrieval system (RAPTOR RAG).
 
@@ -92,9 +133,100 @@ def answer_llm(question: str, context: List, show_sources: bool = True) -> str:
 
     Provide a comprehensive, well-structured answer based on the hierarchical context above:
     """
+    return prompt, sources
+
+
+class AnswerCleaner:
+    """
+    Incremental version of the answer cleanup: strips every line, drops empty
+    lines, repeated lines and '###' headers, and joins the rest with newlines.
+    Text is released as soon as the current line can no longer turn into a
+    duplicate or a header, so most tokens pass straight through; the output
+    is identical to cleaning the complete answer at once.
+    """
+
+    def __init__(self):
+        self.seen_lines = set()
+        self.line = ""
+        self.streaming = False
+        self.pending_space = ""
+        self.lines_out = 0
+
+    def _can_stream(self, partial):
+        return (
+            partial
+            and not partial.startswith('###')
+            and not '###'.startswith(partial)
+            and not any(seen.startswith(partial) for seen in self.seen_lines)
+        )
+
+    def _add(self, segment):
+        self.line += segment
+        if not self.streaming:
+            partial = self.line.strip()
+            if not self._can_stream(partial):
+                return ""
+            self.streaming = True
+            stripped = self.line.lstrip()
+            text = stripped.rstrip()
+            self.pending_space = stripped[len(text):]
+            return ("\n" if self.lines_out else "") + text
+
+        content = self.pending_space + segment
+        text = content.rstrip()
+        self.pending_space = content[len(text):]
+        return text
+
+    def _end_line(self):
+        line = self.line.strip()
+        out = ""
+        if self.streaming:
+            self.seen_lines.add(line)
+            self.lines_out += 1
+        elif line and line not in self.seen_lines and not line.startswith('###'):
+            out = ("\n" if self.lines_out else "") + line
+            self.seen_lines.add(line)
+            self.lines_out += 1
+        self.line, self.streaming, self.pending_space = "", False, ""
+        return out
 
+    def feed(self, text: str) -> str:
+        """Consume a chunk of model output and return the cleaned text that can be emitted now."""
+        segments = text.split('\n')
+        out = [self._add(segments[0])]
+        for segment in segments[1:]:
+            out.append(self._end_line())
+            out.append(self._add(segment))
+        return "".join(out)
+
+    def finish(self) -> str:
+        return self._end_line()
+
+
+class GenerationError(Exception):
+    """No answer could be generated; the message is the text shown to the user instead."""
+
+
+def _failure_text(error: GenerationError, emitted: bool) -> str:
+    return ("\n\n" if emitted else "") + str(error)
+
+
+def _generate(question: str, context: List, show_sources: bool = True) -> Iterator[str]:
+    """Yield the cleaned answer as tokens arrive; raises GenerationError when there is no context or the LLM fails."""
+    start_time = time.time()
+    
+    if not context:
+        logger.warning(f"No context found for question: {question[:100]}...")
+        raise GenerationError("❌ No relevant context found for your question.")
+    
+    with metrics.span("context_build"):
+        prompt, sources = build_prompt(question, context)
+    cleaner = AnswerCleaner()
+    first_token_time = None
+
+    metrics.count("llm_calls")
     try:
-        response = ollama.chat(
+        stream = chat_backend(
             model=CONFIG["model"],
             messages=[{"role": "user", "content": prompt}],
             options={
@@ -103,71 +235,125 @@ def answer_llm(question: str, context: List, show_sources: bool = True) -> str:
                 "top_k": CONFIG["top_k"],
                 "repeat_penalty": CONFIG["repeat_penalty"],
                 "stop": ["Question:", "Context:", "Hierarchical Context:", "Guidelines:"]
-            }
+            },
+            stream=True
         )
         
-        # Clean up the response
-        answer = response['message']['content'].strip()
-        
-        # Remove duplicate lines and formatting artifacts
-        lines = answer.split('\n')
-        cleaned_lines = []
-        seen_lines = set()
-        
-        for line in lines:
-            line = line.strip()
-            if line and line not in seen_lines and not line.startswith('###'):
-                cleaned_lines.append(line)
-                seen_lines.add(line)
-        
-        final_answer = '\n'.join(cleaned_lines)
+        # Clean up the response line by line: remove duplicate lines and formatting artifacts
+        for chunk in stream:
+            text = cleaner.feed(chunk['message']['content'])
+            if text:
+                if first_token_time is None:
+                    first_token_time = time.time() - start_time
+                yield text
+        text = cleaner.finish()
+        if text:
+            yield text
         
         # Add source information if requested
         if show_sources and sources:
             source_list = '\n'.join([f"• {source}" for source in sorted(sources)])
-            final_answer += f"\n\n**Sources consulted:**\n{source_list}"
+            yield f"\n\n**Sources consulted:**\n{source_list}"
         
         # Log successful completion
         elapsed_time = time.time() - start_time
+        metrics.timing("generation", elapsed_time)
+        if first_token_time is not None:
+            metrics.timing("first_token", first_token_time)
+            logger.info(f"First token after {first_token_time:.2f} seconds")
         logger.info(f"Answer generated successfully in {elapsed_time:.2f} seconds")
         
-        return final_answer
-        
     except Exception as e:
         error_msg = f"❌ Error generating answer: {str(e)}\nPlease check if Ollama is running and the model '{CONFIG['model']}' is available."
         logger.error(f"LLM error: {str(e)}")
-        return error_msg
-    
+        metrics.count("llm_errors")
+        raise GenerationError(error_msg) from e
 
 
-def save_query_history(question: str, answer: str, sources: List[str], response_time: float):
-    """Save query history to JSON file."""
+def stream_answer(question: str, context: List, show_sources: bool = True) -> Iterator[str]:
+    """Generate an answer using hierarchical RAPTOR RAG context and LLM, yielding cleaned text as tokens arrive."""
+    emitted = False
     try:
-        history_entry = {
-            "timestamp": datetime.now().isoformat(),
-            "question": question,
-            "answer": answer,
-            "sources": list(sources),
-            "response_time": response_time,
-            "model": CONFIG["model"]
-        }
-        
-        # Load existing history
-        try:
-            with open("query_history.json", "r", encoding="utf-8") as f:
-                history = json.load(f)
-        except FileNotFoundError:
-            history = []
-        
-        # Add new entry
-        history.append(history_entry)
-        
-        # Save updated history
-        with open("query_history.json", "w", encoding="utf-8") as f:
-            json.dump(history, f, indent=2, ensure_ascii=False)
-            
-    except Exception as e:
-        logger.error(f"Failed to save query history: {str(e)}")
+        for text in _generate(question, context, show_sources=show_sources):
+            emitted = True
+            yield text
+    except GenerationError as e:
+        yield _failure_text(e, emitted)
+
+
+def generate_answer(question: str, context: List, show_sources: bool = True) -> Tuple[str, bool]:
+    """answer_llm plus whether generation succeeded; failed answers carry the error text and must not be cached."""
+    parts = []
+    try:
+        for text in _generate(question, context, show_sources=show_sources):
+            parts.append(text)
+    except GenerationError as e:
+        return "".join(parts) + _failure_text(e, bool(parts)), False
+    return "".join(parts), True
+
+
+def answer_llm(question: str, context: List, show_sources: bool = True) -> str:
+    """Generate an answer using hierarchical RAPTOR RAG context and LLM."""
+    return generate_answer(question, context, show_sources=show_sources)[0]
+
+
+def query_sources(results: List) -> List[str]:
+    """Distinct sources of the retrieved documents, for history entries."""
+    sources = set()
+    for doc in results:
+        source = doc.metadata.get('source', 'Unknown source')
+        sources.add(source)
+    return list(sources)
+
+
+def save_query_history(question: str, answer: str, sources: List[str], response_time: float):
+    """Queue a query for the append-only history; the write happens on a background thread."""
+    get_history().record({
+        "timestamp": datetime.now().isoformat(),
+        "question": question,
+        "answer": answer,
+        "sources": list(sources),
+        "response_time": response_time,
+        "model": CONFIG["model"]
+    })
+
+
+def retrieve_context(question: str, top_k_root: int, top_k_children: int,
+                     query_vector: Optional[List[float]] = None) -> List:
+    """Retrieve with the configured mode: RAPTOR tree descent, collapsed-tree top-k or tree + BM25 hybrid."""
+    if CONFIG["retrieval_mode"] == "hybrid":
+        return hybrid_retrieve(question, top_k_root=top_k_root, top_k_children=top_k_children,
+                               lexical_k=CONFIG["lexical_top_k"], rrf_k=CONFIG["rrf_k"], query_vector=query_vector)
+    if CONFIG["retrieval_mode"] == "collapsed":
+        return collapsed_retrieve(question, top_k=CONFIG["collapsed_top_k"],
+                                  level_weights=CONFIG["collapsed_level_weights"], query_vector=query_vector)
+    return raptor_retrieve(question, top_k_root=top_k_root, top_k_children=top_k_children, query_vector=query_vector)
+
+
+def lookup_answer(query_vector: List[float], top_k_root: int, top_k_children: int, show_sources: bool) -> Optional[dict]:
+    """Cached answer for a near-identical earlier question whose chunks are unchanged, or None."""
+    cached = answer_cache.lookup(
+        query_vector,
+        (CONFIG["model"], CONFIG["retrieval_mode"], top_k_root, top_k_children, show_sources),
+        is_valid=lambda entry: fingerprint_is_current(entry["fingerprint"])
+    )
+    metrics.count("answer_cache", result="hit" if cached else "miss")
+    return cached
+
+
+def remember_answer(query_vector: List[float], top_k_root: int, top_k_children: int, show_sources: bool,
+                    answer: str, results: List, ok: bool):
+    """Cache a generated answer; failed generations (`ok` False) and empty contexts are not cached."""
+    if not ok or not results:
+        return
+    answer_cache.store(
+        query_vector,
+        (CONFIG["model"], CONFIG["retrieval_mode"], top_k_root, top_k_children, show_sources),
+        answer,
+        [doc.metadata.get('id') for doc in results],
+        fingerprint=context_fingerprint(results),
+        sources=query_sources(results)
+    )
 
 
 def interactive_query():
@@ -191,6 +377,7 @@ def interactive_query():
                 print("• Type any biomedical question to get an answer")
                 print("• 'config' - Show current configuration")
                 print("• 'stats' - Show query statistics")
+                print("• 'metrics' - Show stage timings and counters (when metrics are enabled)")
                 print("• 'help' - Show this help message")
                 print("• 'quit'/'exit'/'q' - Exit the system")
                 continue
@@ -202,29 +389,60 @@ def interactive_query():
                 continue
             
             if query.lower() == 'stats':
-                try:
-                    with open("query_history.json", "r", encoding="utf-8") as f:
-                        history = json.load(f)
+                stats = get_history().stats()
+                if stats["count"]:
                     print(f"\n📊 Query Statistics:")
-                    print(f"• Total queries: {len(history)}")
-                    if history:
-                        avg_time = sum(entry.get('response_time', 0) for entry in history) / len(history)
-                        print(f"• Average response time: {avg_time:.2f} seconds")
-                        recent_query = history[-1]
-                        print(f"• Last query: {recent_query['timestamp']}")
-                except FileNotFoundError:
+                    print(f"• Total queries: {stats['count']}")
+                    print(f"• Average response time: {stats['mean']:.2f} seconds")
+                    print(f"• p50 / p95 response time: {stats['p50']:.2f} / {stats['p95']:.2f} seconds")
+                    print(f"• Last query: {stats['last_timestamp']}")
+                    for model, model_stats in sorted(stats["models"].items()):
+                        print(f"• {model}: {model_stats['count']} queries, mean {model_stats['mean']:.2f}s, "
+                              f"p50 {model_stats['p50']:.2f}s, p95 {model_stats['p95']:.2f}s")
+                else:
                     print("\n📊 No query history found yet.")
+                cache_stats = answer_cache.stats()
+                print(f"• Answer cache: {cache_stats['entries']} entries, {cache_stats['hits']} hits, "
+                      f"{cache_stats['misses']} misses ({cache_stats['hit_rate']:.0%} hit rate)")
+                continue
+            
+            if query.lower() == 'metrics':
+                if not metrics.enabled:
+                    print("\n📈 Metrics are disabled; set CONFIG['metrics_enabled'] = True.")
+                    continue
+                print("\n📈 Metrics:")
+                print(metrics.prometheus(), end="")
+                metrics.write_json(CONFIG["metrics_json_path"])
+                print(f"• Written to {CONFIG['metrics_json_path']}")
                 continue
             
             if not query:
                 print("⚠️  Please enter a valid question.")
                 continue
             
-            print("🔍 Retrieving relevant information from hierarchical knowledge base...")
             start_time = time.time()
+            metrics.count("queries")
+            top_k_root, top_k_children = CONFIG["default_top_k_root"], CONFIG["default_top_k_children"]
+            query_vector = embed_query(query)
+            
+            cached = lookup_answer(query_vector, top_k_root, top_k_children, True)
+            if cached:
+                response_time = time.time() - start_time
+                metrics.timing("query", response_time)
+                print(f"⚡ Answered from cache (similarity {cached['similarity']:.3f})")
+                print("=" * 70)
+                print("📋 ANSWER:")
+                print("=" * 70)
+                print(cached["answer"])
+                print("=" * 70)
+                print(f"⏱️  Response time: {response_time:.2f} seconds")
+                save_query_history(query, cached["answer"], cached["sources"], response_time)
+                continue
+            
+            print("🔍 Retrieving relevant information from hierarchical knowledge base...")
             
             # Retrieve with optimized parameters for biomedical content
-            results = raptor_retrieve(query, top_k_root=CONFIG["default_top_k_root"], top_k_children=CONFIG["default_top_k_children"])
+            results = retrieve_context(query, top_k_root, top_k_children, query_vector=query_vector)
             
             if not results:
                 print("❌ No relevant information found. Try rephrasing your question.")
@@ -233,25 +451,31 @@ def interactive_query():
             print(f"📚 Found {len(results)} relevant chunks across hierarchy levels")
             print("\n🤖 Generating comprehensive answer...\n")
             
-            # Generate answer
-            answer = answer_llm(query, results, show_sources=True)
-            response_time = time.time() - start_time
-            
-            # Extract sources for history
-            sources = set()
-            for doc in results:
-                source = doc.metadata.get('source', 'Unknown source')
-                sources.add(source)
-            
             print("=" * 70)
             print("📋 ANSWER:")
             print("=" * 70)
-            print(answer)
+            
+            # Stream the answer as it is generated
+            answer_parts, ok = [], True
+            try:
+                for text in _generate(query, results, show_sources=True):
+                    answer_parts.append(text)
+                    print(text, end="", flush=True)
+            except GenerationError as e:
+                ok = False
+                answer_parts.append(_failure_text(e, bool(answer_parts)))
+                print(answer_parts[-1], end="", flush=True)
+            answer = "".join(answer_parts)
+            response_time = time.time() - start_time
+            metrics.timing("query", response_time)
+            
+            print()
             print("=" * 70)
             print(f"⏱️  Response time: {response_time:.2f} seconds")
             
             # Save to history
-            save_query_history(query, answer, list(sources), response_time)
+            save_query_history(query, answer, query_sources(results), response_time)
+            remember_answer(query_vector, top_k_root, top_k_children, True, answer, results, ok)
             
         except KeyboardInterrupt:
             print("\n\n👋 Session interrupted. Goodbye!")
@@ -261,31 +485,80 @@ def interactive_query():
             print("Please try again with a different question.")
 
 
-def single_query(question: str, top_k_root: Optional[int] = None, top_k_children: Optional[int] = None, show_sources: bool = True) -> str:
-    """Process a single query and return the answer."""
+def single_query(question: str, top_k_root: Optional[int] = None, top_k_children: Optional[int] = None, show_sources: bool = True,
+                 query_vector: Optional[List[float]] = None) -> str:
+    """Process a single query and return the answer. `query_vector` skips embedding the question."""
+    top_k_root = top_k_root or CONFIG["default_top_k_root"]
+    top_k_children = top_k_children or CONFIG["default_top_k_children"]
+    
+    metrics.count("queries")
+    with metrics.span("query"):
+        logger.info(f"Processing single query: {question[:100]}...")
+        start_time = time.time()
+        
+        if query_vector is None:
+            query_vector = embed_query(question)
+        cached = lookup_answer(query_vector, top_k_root, top_k_children, show_sources)
+        if cached:
+            logger.info(f"Answer served from cache (similarity {cached['similarity']:.3f})")
+            save_query_history(question, cached["answer"], cached["sources"], time.time() - start_time)
+            return cached["answer"]
+        
+        results = retrieve_context(question, top_k_root, top_k_children, query_vector=query_vector)
+        answer, ok = generate_answer(question, results, show_sources=show_sources)
+        
+        response_time = time.time() - start_time
+        
+        # Save to history
+        save_query_history(question, answer, query_sources(results), response_time)
+        remember_answer(query_vector, top_k_root, top_k_children, show_sources, answer, results, ok)
+        
+        return answer
+
+
+def stream_query(question: str, top_k_root: Optional[int] = None, top_k_children: Optional[int] = None, show_sources: bool = True,
+                 query_vector: Optional[List[float]] = None) -> Iterator[str]:
+    """Streaming counterpart of single_query: yields the answer as it is generated, then saves history."""
     top_k_root = top_k_root or CONFIG["default_top_k_root"]
     top_k_children = top_k_children or CONFIG["default_top_k_children"]
     
-    logger.info(f"Processing single query: {question[:100]}...")
+    logger.info(f"Processing streaming query: {question[:100]}...")
+    metrics.count("queries")
     start_time = time.time()
     
-    results = raptor_retrieve(question, top_k_root=top_k_root, top_k_children=top_k_children)
-    answer = answer_llm(question, results, show_sources=show_sources)
+    if query_vector is None:
+        query_vector = embed_query(question)
+    cached = lookup_answer(query_vector, top_k_root, top_k_children, show_sources)
+    if cached:
+        logger.info(f"Answer served from cache (similarity {cached['similarity']:.3f})")
+        yield cached["answer"]
+        response_time = time.time() - start_time
+        metrics.timing("query", response_time, stream="true")
+        save_query_history(question, cached["answer"], cached["sources"], response_time)
+        return
     
-    response_time = time.time() - start_time
+    results = retrieve_context(question, top_k_root, top_k_children, query_vector=query_vector)
+    answer_parts, ok = [], True
+    try:
+        for text in _generate(question, results, show_sources=show_sources):
+            answer_parts.append(text)
+            yield text
+    except GenerationError as e:
+        ok = False
+        answer_parts.append(_failure_text(e, bool(answer_parts)))
+        yield answer_parts[-1]
+    answer = "".join(answer_parts)
     
-    # Extract sources for history
-    sources = set()
-    for doc in results:
-        source = doc.metadata.get('source', 'Unknown source')
-        sources.add(source)
+    response_time = time.time() - start_time
+    metrics.timing("query", response_time, stream="true")
     
     # Save to history
-    save_query_history(question, answer, list(sources), response_time)
-    
-    return answer
+    save_query_history(question, answer, query_sources(results), response_time)
+    remember_answer(query_vector, top_k_root, top_k_children, show_sources, answer, results, ok)
 
 
 if __name__ == "__main__":
+    # Load the retriever and embedding model before the first question
+    warm_up()
     # Run interactive mode by default
     interactive_query()
\ No newline at end of file
@@ -0,0 +1,109 @@
+import time
+import threading
+from collections import OrderedDict
+import numpy as np
+
+
+class SemanticAnswerCache:
+    """
+    Answer cache keyed on query-embedding similarity.
+    A new question reuses a cached answer when its cosine similarity to a
+    cached question is at least `threshold`, the retrieval parameters match,
+    and the caller confirms the underlying chunks are unchanged. Entries
+    expire after `ttl` seconds and the least recently used entry is evicted
+    once `max_entries` is reached.
+    """
+
+    def __init__(self, threshold=0.95, max_entries=512, ttl=3600.0):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self._next_key = 0
+        self._matrix = None
+        self._keys = []
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.invalidated = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _normalize(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def _drop(self, key):
+        del self.entries[key]
+        self._matrix = None
+
+    def _stacked(self):
+        if self._matrix is None:
+            self._keys = list(self.entries)
+            self._matrix = (
+                np.vstack([self.entries[key]["vector"] for key in self._keys])
+                if self._keys else np.empty((0, 0), dtype=np.float32)
+            )
+        return self._keys, self._matrix
+
+    def lookup(self, query_vector, params, is_valid=lambda entry: True):
+        """
+        Return the best matching cached entry ({"answer", "chunk_ids", "sources", "similarity", ...}) or None.
+        `is_valid(entry)` should return False when the entry's chunks changed since it was stored.
+        """
+        query = self._normalize(query_vector)
+        now = time.time()
+        with self._lock:
+            for key in [key for key, entry in self.entries.items() if now - entry["created"] > self.ttl]:
+                self._drop(key)
+                self.expired += 1
+
+            keys, matrix = self._stacked()
+            if keys:
+                scores = matrix @ query
+                for row in np.argsort(-scores):
+                    if scores[row] < self.threshold:
+                        break
+                    key = keys[row]
+                    entry = self.entries[key]
+                    if entry["params"] != params:
+                        continue
+                    if not is_valid(entry):
+                        self._drop(key)
+                        self.invalidated += 1
+                        continue
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return dict(entry, similarity=float(scores[row]))
+            self.misses += 1
+            return None
+
+    def store(self, query_vector, params, answer, chunk_ids, fingerprint=None, sources=()):
+        with self._lock:
+            self.entries[self._next_key] = {
+                "vector": self._normalize(query_vector),
+                "params": params,
+                "answer": answer,
+                "chunk_ids": list(chunk_ids),
+                "sources": list(sources),
+                "fingerprint": fingerprint,
+                "created": time.time()
+            }
+            self._next_key += 1
+            self._matrix = None
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "expired": self.expired,
+            "invalidated": self.invalidated,
+            "evictions": self.evictions
+        }
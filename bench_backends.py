@@ -0,0 +1,158 @@
+import os
+import json
+import time
+import argparse
+import tempfile
+import multiprocessing
+import numpy as np
+
+from raptor_artifacts import ArtifactStore
+from vector_backends import BACKENDS
+
+QUERIES = [
+    "How does the SphygmoCor XCEL measure blood pressure?",
+    "What is pulse wave velocity and how is it calculated?",
+    "How do I calibrate the cuff pressure before a measurement?",
+    "What does the ARTSENS probe measure?",
+    "What should I do if the battery error appears?",
+    "How do I print a measurement report?",
+]
+
+
+def make_embedder(use_ollama):
+    if use_ollama:
+        from langchain_ollama import OllamaEmbeddings
+        from embedding_cache import EmbeddingCache, CachedEmbedder
+        from r6_retrieval_mechs import EMBED_MODEL
+        return CachedEmbedder(OllamaEmbeddings(model=EMBED_MODEL), EmbeddingCache(EMBED_MODEL))
+    from local_backends import HashingEmbedder
+    return HashingEmbedder()
+
+
+def open_at(name, embedder, directory):
+    return BACKENDS[name](embedder, os.path.join(directory, name))
+
+
+def tree_nodes():
+    store = ArtifactStore(readonly=True)
+    ids, texts, metadatas = [], [], []
+    for file_id, level_num, chunk in store.iter_nodes():
+        ids.append(chunk["id"])
+        texts.append(chunk["text"])
+        metadatas.append({"id": chunk["id"], "file_id": file_id, "level": level_num})
+    store.close()
+    return ids, texts, metadatas
+
+
+def latencies(fn, args_list, repeat):
+    samples = []
+    for _ in range(repeat):
+        for args in args_list:
+            start = time.perf_counter()
+            fn(*args)
+            samples.append(time.perf_counter() - start)
+    ms = np.asarray(samples) * 1000
+    return {"p50_ms": float(np.percentile(ms, 50)), "p95_ms": float(np.percentile(ms, 95))}
+
+
+def memory_kib():
+    """Rss, Pss and private memory of this process from /proc (Linux), in KiB."""
+    usage = {}
+    with open("/proc/self/smaps_rollup", "r") as f:
+        for line in f:
+            name, _, value = line.partition(":")
+            if name in ("Rss", "Pss", "Private_Clean", "Private_Dirty", "Shared_Clean"):
+                usage[name] = int(value.split()[0])
+    return {"rss": usage["Rss"], "pss": usage["Pss"], "shared": usage["Shared_Clean"],
+            "private": usage["Private_Clean"] + usage["Private_Dirty"]}
+
+
+def worker(name, use_ollama, directory, ready, done):
+    """Load the tree index on `name` like a query worker would, then report memory growth."""
+    from r6_retrieval_mechs import TreeIndex
+    before = memory_kib()
+    store = ArtifactStore(readonly=True)
+    index = TreeIndex(open_at(name, make_embedder(use_ollama), directory), store)
+    index.update(store.digests())
+    index.top_k(np.ones(index.all_matrix.shape[1], dtype=np.float32), 10)  # touch every row
+    ready.wait()  # measure while every worker holds its index
+    after = memory_kib()
+    done.put({key: after[key] - before[key] for key in after})
+
+
+def worker_memory(name, use_ollama, directory, workers):
+    context = multiprocessing.get_context("spawn")
+    ready, done = context.Barrier(workers), context.Queue()
+    processes = [context.Process(target=worker, args=(name, use_ollama, directory, ready, done)) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    results = [done.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return {key: sum(result[key] for result in results) / workers for key in results[0]}
+
+
+def benchmark(name, nodes, embedder, args, directory, reference=None):
+    from r6_retrieval_mechs import TreeIndex
+    ids, texts, metadatas = nodes
+    backend = open_at(name, embedder, directory)
+    start = time.perf_counter()
+    backend.build(ids, texts, metadatas)
+    build_seconds = time.perf_counter() - start
+
+    store = ArtifactStore(readonly=True)
+    start = time.perf_counter()
+    index = TreeIndex(open_at(name, embedder, directory), store)
+    index.update(store.digests())
+    load_seconds = time.perf_counter() - start
+    store.close()
+
+    vectors = embedder.embed_documents(QUERIES)
+    file_ids = sorted({metadata["file_id"] for metadata in metadatas})
+    results = {
+        "build_seconds": build_seconds,
+        "tree_index_load_seconds": load_seconds,
+        "search": latencies(backend.search_by_vector, [(v, args.k) for v in vectors], args.repeat),
+        "search_level_0": latencies(backend.search_by_vector, [(v, args.k, {"level": 0}) for v in vectors], args.repeat),
+        "search_files": latencies(backend.search_by_vector,
+                                  [(v, args.k, {"file_id": {"$in": file_ids[:1]}}) for v in vectors], args.repeat),
+        "worker_memory_kib": worker_memory(name, args.ollama, directory, args.workers),
+    }
+    top = [[node_id for node_id, _ in backend.search_by_vector(v, args.k)] for v in vectors]
+    if reference is not None:
+        results["overlap_at_k"] = float(np.mean([len(set(a) & set(b)) / args.k for a, b in zip(top, reference)]))
+    return results, top
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare vector backends: build, search latency and per-worker memory.")
+    parser.add_argument("--backends", default="chroma,memmap")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=4, help="processes loading the tree index at once")
+    parser.add_argument("--ollama", action="store_true", help="embed with Ollama instead of the offline stub")
+    parser.add_argument("--output", default="bench_backends.json")
+    args = parser.parse_args()
+
+    nodes = tree_nodes()
+    embedder = make_embedder(args.ollama)
+    print(f"⏱️  Vector backend benchmark: {len(nodes[0])} nodes, {args.workers} workers")
+
+    results, reference = {}, None
+    with tempfile.TemporaryDirectory() as directory:
+        for name in args.backends.split(","):
+            results[name], top = benchmark(name, nodes, embedder, args, directory, reference)
+            reference = reference or top
+            r = results[name]
+            memory = r["worker_memory_kib"]
+            print(f"--- {name} ---")
+            print(f"• build {r['build_seconds']:.2f} s, tree index load {r['tree_index_load_seconds'] * 1000:.1f} ms")
+            for key in ("search", "search_level_0", "search_files"):
+                print(f"• {key}: p50 {r[key]['p50_ms']:.3f} ms, p95 {r[key]['p95_ms']:.3f} ms")
+            print(f"• per worker: +{memory['private'] / 1024:.1f} MiB private, +{memory['pss'] / 1024:.1f} MiB PSS")
+            if "overlap_at_k" in r:
+                print(f"• top-{args.k} overlap with {args.backends.split(',')[0]}: {r['overlap_at_k']:.0%}")
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"✅ Results written to {args.output}")
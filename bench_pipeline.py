@@ -0,0 +1,195 @@
+import json
+import logging
+import time
+import argparse
+import platform
+import resource
+import importlib
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+import r6_retrieval_mechs as retrieval
+from local_backends import HashingEmbedder, StubChat
+from query_metrics import metrics
+
+query_llm = importlib.import_module("7_query_llm")
+
+# Fixed question set, so runs are comparable across commits
+QUESTIONS = [
+    "How does the SphygmoCor XCEL measure blood pressure?",
+    "What is pulse wave velocity and how is it calculated?",
+    "How do I calibrate the cuff pressure before a measurement?",
+    "What does the ARTSENS probe measure?",
+    "How do I install the SphygmoCor server software?",
+    "What should I do if the battery error appears?",
+    "How are patient records stored in the database?",
+    "What is the recommended position of the patient during a PWV measurement?",
+    "How do I print a measurement report?",
+    "What are the contraindications for carotid-femoral measurements?",
+    "How is central aortic pressure derived from the brachial waveform?",
+    "How do I clean and maintain the tonometer?",
+]
+
+# Upper bounds (ms) of the latency histogram buckets
+BUCKETS_MS = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, float("inf")]
+
+
+def stage_summaries():
+    """
+    Latency summary per span recorded by query_metrics since the last reset,
+    keyed like "search[depth=0]" or "retrieve[mode=tree]".
+    """
+    with metrics.lock:
+        samples = {key: list(values) for key, values in metrics.samples.items()}
+    stages = {}
+    for (name, labels), values in samples.items():
+        label_text = ",".join(f"{key}={value}" for key, value in labels)
+        stages[f"{name}[{label_text}]" if label_text else name] = latency_summary(values)
+    return dict(sorted(stages.items()))
+
+
+def latency_summary(seconds):
+    ms = np.asarray(seconds) * 1000
+    counts = np.bincount(np.searchsorted(BUCKETS_MS, ms), minlength=len(BUCKETS_MS))
+    return {
+        "count": int(ms.size),
+        "mean_ms": float(ms.mean()),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "max_ms": float(ms.max()),
+        "histogram": {("+Inf" if le == float("inf") else str(le)): int(n) for le, n in zip(BUCKETS_MS, counts)},
+    }
+
+
+def run_question(question, top_k_root, top_k_children):
+    """
+    One question through the pipeline: embed, retrieve, build the prompt, generate.
+    The stages are timed by the query path's own spans; embedding bypasses the query cache.
+    """
+    with metrics.span("query"):
+        with metrics.span("embed"):
+            query_vector = retrieval.get_embeddings().embed_query(question)
+        results = query_llm.retrieve_context(question, top_k_root, top_k_children, query_vector=query_vector)
+        query_llm.answer_llm(question, results)
+
+
+def run_load(questions, concurrency, top_k_root, top_k_children):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(lambda q: run_question(q, top_k_root, top_k_children), questions))
+    return time.perf_counter() - start
+
+
+def peak_memory(questions, top_k_root, top_k_children):
+    """Peak Python heap (tracemalloc) over one sequential pass, measured separately from the timed runs."""
+    tracemalloc.start()
+    try:
+        for question in questions:
+            run_question(question, top_k_root, top_k_children)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def benchmark_mode(mode, questions, concurrency_levels, top_k_root, top_k_children):
+    query_llm.CONFIG["retrieval_mode"] = mode
+    for question in questions[:3]:  # warm the index and code paths
+        run_question(question, top_k_root, top_k_children)
+
+    throughput = {}
+    stages = None
+    for concurrency in concurrency_levels:
+        metrics.reset()
+        elapsed = run_load(questions, concurrency, top_k_root, top_k_children)
+        throughput[str(concurrency)] = {"seconds": elapsed, "queries_per_second": len(questions) / elapsed}
+        if concurrency == 1:
+            stages = stage_summaries()  # stage latencies come from the sequential run only
+        print(f"• {mode} x{concurrency}: {len(questions) / elapsed:.1f} queries/s")
+
+    heap_peak = peak_memory(questions, top_k_root, top_k_children)
+    return {"stages": stages, "throughput": throughput, "tracemalloc_peak_bytes": heap_peak}
+
+
+def _change(old, new):
+    return f"{new / old - 1:+.0%}" if old > 0 else "n/a"
+
+
+def compare(results, baseline_path):
+    """Print p50/p95 changes per stage against an earlier results file."""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    for mode, mode_results in results["modes"].items():
+        old_stages = baseline.get("modes", {}).get(mode, {}).get("stages", {})
+        for stage, summary in mode_results["stages"].items():
+            old = old_stages.get(stage)
+            if not old:
+                continue
+            print(f"• {mode}/{stage}: p50 {old['p50_ms']:.2f} → {summary['p50_ms']:.2f} ms "
+                  f"({_change(old['p50_ms'], summary['p50_ms'])}), "
+                  f"p95 {old['p95_ms']:.2f} → {summary['p95_ms']:.2f} ms "
+                  f"({_change(old['p95_ms'], summary['p95_ms'])})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark retrieval and generation with the offline stub embedder and LLM.")
+    parser.add_argument("--repeat", type=int, default=5, help="passes over the question set")
+    parser.add_argument("--concurrency", default="1,2,4,8",
+                        help="comma-separated worker counts; must include 1, the run stage latencies come from")
+    parser.add_argument("--modes", default="tree,collapsed", help="retrieval modes to benchmark")
+    parser.add_argument("--llm-delay", type=float, default=0.0, help="seconds the stub LLM spends per answer")
+    parser.add_argument("--top-k-root", type=int, default=query_llm.CONFIG["default_top_k_root"])
+    parser.add_argument("--top-k-children", type=int, default=query_llm.CONFIG["default_top_k_children"])
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", help="earlier results file to compare against")
+    args = parser.parse_args()
+
+    # Keep benchmark queries out of raptor_rag_queries.log
+    query_llm.logger.setLevel(logging.ERROR)
+    concurrency_levels = [int(n) for n in args.concurrency.split(",")]
+    if 1 not in concurrency_levels:
+        parser.error("--concurrency must include 1")
+    retrieval.set_embeddings(HashingEmbedder())
+    query_llm.chat_backend = StubChat(delay=args.llm_delay)
+    retrieval.warm_up(load_embedder=False)
+    metrics.enable(keep_samples=True)
+
+    questions = QUESTIONS * args.repeat
+    print(f"⏱️  Pipeline benchmark: {len(questions)} questions")
+
+    results = {
+        "timestamp": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "settings": {
+            "questions": len(questions),
+            "concurrency": concurrency_levels,
+            "llm_delay": args.llm_delay,
+            "top_k_root": args.top_k_root,
+            "top_k_children": args.top_k_children,
+            "max_context_tokens": query_llm.CONFIG["max_context_tokens"],
+            "collapsed_top_k": query_llm.CONFIG["collapsed_top_k"],
+        },
+        "modes": {},
+    }
+    for mode in args.modes.split(","):
+        results["modes"][mode] = benchmark_mode(mode, questions, concurrency_levels,
+                                                args.top_k_root, args.top_k_children)
+    # ru_maxrss is in KiB on Linux
+    results["max_rss_bytes"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    for mode, mode_results in results["modes"].items():
+        print(f"--- {mode} (peak heap {mode_results['tracemalloc_peak_bytes'] / 2**20:.1f} MiB) ---")
+        for stage, summary in mode_results["stages"].items():
+            print(f"• {stage}: n={summary['count']} p50 {summary['p50_ms']:.2f} ms, "
+                  f"p95 {summary['p95_ms']:.2f} ms, max {summary['max_ms']:.2f} ms")
+    print(f"• max RSS {results['max_rss_bytes'] / 2**20:.1f} MiB")
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"✅ Results written to {args.output}")
+    if args.baseline:
+        compare(results, args.baseline)
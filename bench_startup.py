@@ -0,0 +1,40 @@
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+
+MODULES = ["r6_retrieval_mechs", "7_query_llm"]
+
+
+def time_import(module, runs):
+    """Wall-clock time of a fresh interpreter importing `module`, minus bare interpreter startup."""
+    def run(code):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], check=True)
+        return time.perf_counter() - start
+
+    baseline = [run("pass") for _ in range(runs)]
+    imports = [run(f"import importlib; importlib.import_module({module!r})") for _ in range(runs)]
+    return statistics.median(imports) - statistics.median(baseline), min(imports) - min(baseline)
+
+
+def time_warm_up():
+    from r6_retrieval_mechs import warm_up
+    start = time.perf_counter()
+    warm_up()
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure import and warm-up time of the query path.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--warm", action="store_true", help="also time warm_up() (needs Ollama and chroma_store)")
+    args = parser.parse_args()
+
+    print("⏱️  Startup benchmark")
+    for module in MODULES:
+        median, best = time_import(module, args.runs)
+        print(f"• import {module}: median {median * 1000:.1f} ms, best {best * 1000:.1f} ms")
+    if args.warm:
+        print(f"• warm_up(): {time_warm_up():.2f} s")
@@ -0,0 +1,97 @@
+import re
+import threading
+
+# Resolved on the first count_tokens() call: loading cl100k_base may download its BPE file
+_encoding = None
+_encoding_loaded = False
+_encoding_lock = threading.Lock()
+
+_CHUNK_ID_RE = re.compile(r"^(?P<file>.+)_chunk_(?P<index>\d+)_level_0$")
+# Shortest shared prefix/suffix treated as splitter overlap rather than coincidence
+MIN_OVERLAP = 20
+
+
+def _get_encoding():
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        with _encoding_lock:
+            if not _encoding_loaded:
+                try:
+                    import tiktoken
+                    _encoding = tiktoken.get_encoding("cl100k_base")
+                except Exception:  # tiktoken missing, or its encoding file cannot be fetched
+                    _encoding = None
+                _encoding_loaded = True
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    """Token count with tiktoken's cl100k_base BPE when available, else a ~4 characters/token estimate."""
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+
+def _overlap(head: str, tail: str, max_overlap: int) -> int:
+    """Length of the longest suffix of `head` that is also a prefix of `tail`."""
+    for k in range(min(len(head), len(tail), max_overlap), MIN_OVERLAP - 1, -1):
+        if head.endswith(tail[:k]):
+            return k
+    return 0
+
+
+def _rank_key(doc):
+    return (-doc.metadata.get("score", 0.0), doc.metadata.get("level", 0))
+
+
+def pack_context(docs, token_budget: int, chunk_overlap: int = 100, header=lambda doc: ""):
+    """
+    Greedily pack retrieved documents into a token budget.
+
+    Documents are ranked by similarity score (higher first), then by level
+    (more specific first). Exact duplicate texts are dropped, and the text
+    shared with an already-packed neighbouring level-0 chunk (the splitter's
+    `chunk_overlap`) is trimmed. Each document, with its `header(doc)`, is
+    added if it still fits, so a large low-ranked chunk never crowds out
+    better evidence.
+
+    Returns: (packed [(doc, text)] in rank order, stats dict)
+    """
+    packed, seen_texts, packed_chunks = [], set(), {}
+    used = dropped = trimmed_chars = 0
+    max_overlap = chunk_overlap + chunk_overlap // 2
+
+    for doc in sorted(docs, key=_rank_key):
+        text = doc.page_content.strip()
+        if text in seen_texts:
+            continue
+
+        match = _CHUNK_ID_RE.match(str(doc.metadata.get("id", "")))
+        if match:
+            file_id, index = match.group("file"), int(match.group("index"))
+            previous = packed_chunks.get((file_id, index - 1))
+            following = packed_chunks.get((file_id, index + 1))
+            if previous is not None:
+                k = _overlap(previous, text, max_overlap)
+                text = text[k:].lstrip()
+                trimmed_chars += k
+            if following is not None:
+                k = _overlap(text, following, max_overlap)
+                text = text[:len(text) - k].rstrip()
+                trimmed_chars += k
+
+        cost = count_tokens(header(doc) + text)
+        if not text or used + cost > token_budget:
+            dropped += 1
+            continue
+
+        used += cost
+        seen_texts.add(doc.page_content.strip())
+        if match:
+            packed_chunks[(file_id, index)] = doc.page_content.strip()
+        packed.append((doc, text))
+
+    stats = {"tokens": used, "budget": token_budget, "packed": len(packed),
+             "dropped": dropped, "trimmed_chars": trimmed_chars}
+    return packed, stats
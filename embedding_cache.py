@@ -0,0 +1,148 @@
+import os
+import re
+import time
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingCache:
+    """
+    On-disk embedding cache keyed by (model, text hash).
+    Vectors for one model live in a single append-only float32 file that is
+    read back through a memory map, with a parallel file of text hashes
+    (line N describes row N), so cached vectors cost no parsing and are
+    shared through the page cache.
+    """
+
+    def __init__(self, model, directory="essentials/embedding_cache"):
+        self.model = model
+        os.makedirs(directory, exist_ok=True)
+        stem = os.path.join(directory, re.sub(r"[^\w.-]", "_", model))
+        self.vectors_path = stem + ".f32"
+        self.hashes_path = stem + ".hashes"
+        self.dim_path = stem + ".dim"
+        self._lock = threading.Lock()
+        self._rows = {}
+        self._mapped = None
+        self.dim = None
+
+        if os.path.exists(self.dim_path):
+            with open(self.dim_path, "r") as f:
+                self.dim = int(f.read())
+            self._recover()
+
+    def _recover(self):
+        """
+        Cut both files back to the rows present in both. put_many appends the
+        vectors before the hashes, so a crash in between leaves vector rows (or
+        a half-written hash line) that no hash describes; left in place, every
+        row appended later would be read one or more rows off.
+        """
+        row_bytes = 4 * self.dim
+        hashes = []
+        if os.path.exists(self.hashes_path):
+            with open(self.hashes_path, "r") as f:
+                hashes = f.read().split("\n")[:-1]  # the last element is empty, or a line cut short
+        vector_bytes = os.path.getsize(self.vectors_path) if os.path.exists(self.vectors_path) else 0
+        complete = min(len(hashes), vector_bytes // row_bytes)
+        hashes = hashes[:complete]
+        hash_text = "".join(text_hash + "\n" for text_hash in hashes)
+        hash_bytes = os.path.getsize(self.hashes_path) if os.path.exists(self.hashes_path) else 0
+        if hash_bytes != len(hash_text) or vector_bytes != complete * row_bytes:
+            logger.warning(f"Embedding cache for {self.model}: keeping {complete} complete rows after an interrupted write")
+            with open(self.hashes_path, "w") as f:
+                f.write(hash_text)
+            with open(self.vectors_path, "ab") as f:
+                f.truncate(complete * row_bytes)
+        self._rows = {text_hash: row for row, text_hash in enumerate(hashes)}
+
+    @staticmethod
+    def text_hash(text):
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def __len__(self):
+        return len(self._rows)
+
+    def _matrix(self):
+        if self._mapped is None or len(self._mapped) < len(self._rows):
+            self._mapped = np.memmap(self.vectors_path, dtype=np.float32, mode="r").reshape(-1, self.dim)
+        return self._mapped
+
+    def get_many(self, texts):
+        """Return cached vectors for `texts`, with None for every miss."""
+        with self._lock:
+            rows = [self._rows.get(self.text_hash(text)) for text in texts]
+            if not self._rows:
+                return [None] * len(texts)
+            matrix = self._matrix()
+            return [None if row is None else matrix[row].tolist() for row in rows]
+
+    def put_many(self, texts, vectors):
+        with self._lock:
+            new = {}
+            for text, vector in zip(texts, vectors):
+                text_hash = self.text_hash(text)
+                if text_hash not in self._rows and text_hash not in new:
+                    new[text_hash] = vector
+            if not new:
+                return
+
+            matrix = np.asarray(list(new.values()), dtype=np.float32)
+            if self.dim is None:
+                self.dim = matrix.shape[1]
+                with open(self.dim_path, "w") as f:
+                    f.write(str(self.dim))
+            with open(self.vectors_path, "ab") as f:
+                f.write(matrix.tobytes())
+            with open(self.hashes_path, "a") as f:
+                f.write("".join(text_hash + "\n" for text_hash in new))
+            for text_hash in new:
+                self._rows[text_hash] = len(self._rows)
+
+
+class CachedEmbedder:
+    """
+    Wraps an embedder (OllamaEmbeddings, HashingEmbedder, ...) with an
+    EmbeddingCache plus batched, concurrent, retried calls for the misses.
+    Exposes embed_documents / embed_query, so it can be handed to a
+    vectorstore as its embedding function.
+    """
+
+    def __init__(self, embedder, cache, batch_size=32, max_workers=4, max_retries=3, retry_delay=1.0):
+        self.embedder = embedder
+        self.cache = cache
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+
+    def _embed_batch(self, texts):
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self.embedder.embed_documents(texts)
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self.retry_delay * 2 ** attempt
+                logger.warning(f"Embedding batch failed ({e}); retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+    def embed_documents(self, texts):
+        texts = list(texts)
+        vectors = self.cache.get_many(texts)
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, vectors) if vector is None))
+        if missing:
+            batches = [missing[i:i + self.batch_size] for i in range(0, len(missing), self.batch_size)]
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                for batch, batch_vectors in zip(batches, executor.map(self._embed_batch, batches)):
+                    self.cache.put_many(batch, batch_vectors)
+            vectors = self.cache.get_many(texts)
+        return vectors
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
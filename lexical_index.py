@@ -0,0 +1,114 @@
+import re
+import math
+from collections import Counter
+import numpy as np
+
+# Word characters with internal -./ kept together, so "E-102", "v2.1" and "XCEL" survive as terms
+_TOKEN_RE = re.compile(r"[^\W_]+(?:[-./][^\W_]+)*")
+_SEPARATOR_RE = re.compile(r"[-./]")
+K1 = 1.5
+B = 0.75
+
+
+def tokenize(text):
+    """
+    Lowercased terms. A compound like "e-102" is emitted whole, as its parts
+    and joined ("e102"), so queries match however the identifier is written.
+    """
+    tokens = []
+    for token in _TOKEN_RE.findall(text.lower()):
+        tokens.append(token)
+        if not token.isalnum():
+            parts = _SEPARATOR_RE.split(token)
+            tokens.extend(parts)
+            tokens.append("".join(parts))
+    return tokens
+
+
+class BM25Index:
+    """
+    Okapi BM25 over the level-0 chunks, built at chunking time and stored in
+    the artifact store. Postings are kept as one array of chunk rows and one
+    of term frequencies per term, so a query only touches the postings of its
+    own terms and scoring is a few vectorized adds.
+    """
+
+    def __init__(self, doc_ids, lengths, postings, k1=K1, b=B):
+        self.doc_ids = list(doc_ids)
+        self.postings = postings  # term -> (rows int32, term frequencies uint16)
+        self.k1 = k1
+        self.lengths = np.asarray(lengths, dtype=np.int32)
+        average = float(self.lengths.mean()) if len(self.lengths) else 0.0
+        # Per-chunk length normalization term of the BM25 denominator
+        self.norms = (k1 * (1 - b + b * self.lengths / (average or 1.0))).astype(np.float32)
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    @classmethod
+    def build(cls, docs):
+        """Index [(node_id, text)]."""
+        doc_ids, lengths, postings = [], [], {}
+        for row, (node_id, text) in enumerate(docs):
+            counts = Counter(tokenize(text))
+            doc_ids.append(node_id)
+            lengths.append(sum(counts.values()))
+            for term, count in counts.items():
+                postings.setdefault(term, ([], []))
+                postings[term][0].append(row)
+                postings[term][1].append(min(count, 65535))
+        postings = {
+            term: (np.array(rows, dtype=np.int32), np.array(tfs, dtype=np.uint16))
+            for term, (rows, tfs) in postings.items()
+        }
+        return cls(doc_ids, lengths, postings)
+
+    @classmethod
+    def load(cls, store):
+        """The index saved in the artifact store, or None if the chunking stage has not built one."""
+        docs, terms = store.load_lexical_index()
+        if not docs:
+            return None
+        postings = {
+            term: (np.frombuffer(rows, dtype=np.int32), np.frombuffer(tfs, dtype=np.uint16))
+            for term, rows, tfs in terms
+        }
+        return cls([node_id for node_id, _ in docs], [length for _, length in docs], postings)
+
+    @classmethod
+    def from_store(cls, store):
+        """
+        The saved index, or one built in memory from the store's level-0 chunks
+        when it was written before the chunking stage saved a lexical index.
+        """
+        index = cls.load(store)
+        if index is None:
+            index = cls.build(store.iter_level(0))
+        return index
+
+    def save(self, store):
+        store.save_lexical_index(
+            list(zip(self.doc_ids, self.lengths.tolist())),
+            [(term, rows.tobytes(), tfs.tobytes()) for term, (rows, tfs) in self.postings.items()]
+        )
+
+    def search(self, query, k=10):
+        """Top-k (node_id, BM25 score) for the query's terms; chunks sharing no term are never returned."""
+        scores = np.zeros(len(self.doc_ids), dtype=np.float32)
+        n = len(self.doc_ids)
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            rows, tfs = posting
+            idf = math.log(1 + (n - len(rows) + 0.5) / (len(rows) + 0.5))
+            tfs = tfs.astype(np.float32)
+            scores[rows] += idf * tfs * (self.k1 + 1) / (tfs + self.norms[rows])
+
+        matched = np.flatnonzero(scores)
+        if not len(matched) or k <= 0:
+            return []
+        k = min(k, len(matched))
+        top = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(self.doc_ids[row], float(scores[row])) for row in top]
@@ -0,0 +1,72 @@
+import re
+import time
+import hashlib
+import numpy as np
+
+_TOKEN_RE = re.compile(r"\w+")
+_STREAM_TOKEN_RE = re.compile(r"\s*\S+|\s+")
+
+
+class HashingEmbedder:
+    """
+    Deterministic, offline stand-in for OllamaEmbeddings.
+    Hashes word unigrams and bigrams into a fixed number of dimensions and
+    L2-normalizes the result, so similar texts still land close together.
+    Implements the same embed_documents / embed_query interface as the
+    langchain embedders, so it can be passed anywhere they are used.
+    """
+
+    def __init__(self, dim=768):
+        self.dim = dim
+
+    def _embed(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        tokens = _TOKEN_RE.findall(text.lower())
+        for feature in tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]:
+            digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.dim
+            vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+class StubChat:
+    """
+    Deterministic, offline stand-in for ollama.chat.
+    Answers with the question and the first sentence of each context chunk
+    found in the prompt, optionally sleeping `delay` seconds to mimic
+    generation time. Returns the same {"message": {"content": ...}} shape,
+    or an iterator of such chunks (one per word) when called with stream=True.
+    """
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+
+    def _answer(self, prompt):
+        question = prompt.split("Question:", 1)[-1].split("Hierarchical Context", 1)[0].strip()
+        lines = [f"Answer to: {question}"]
+        for block in prompt.split("[Chunk: ")[1:]:
+            chunk_id, _, content = block.partition("]\n")
+            lines.append(f"- {chunk_id}: {content.strip().split('. ')[0][:200]}")
+        return "\n".join(lines)
+
+    def _stream(self, model, answer):
+        tokens = _STREAM_TOKEN_RE.findall(answer)
+        for token in tokens:
+            if self.delay:
+                time.sleep(self.delay / len(tokens))
+            yield {"model": model, "message": {"role": "assistant", "content": token}, "done": False}
+
+    def __call__(self, model=None, messages=(), options=None, stream=False, **kwargs):
+        answer = self._answer(messages[-1]["content"])
+        if stream:
+            return self._stream(model, answer)
+        if self.delay:
+            time.sleep(self.delay)
+        return {"model": model, "message": {"role": "assistant", "content": answer}}
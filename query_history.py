@@ -0,0 +1,198 @@
+import os
+import json
+import math
+import queue
+import atexit
+import sqlite3
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp TEXT NOT NULL,
+    question TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    sources TEXT NOT NULL,
+    response_time REAL NOT NULL,
+    model TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS history_stats (
+    model TEXT PRIMARY KEY,
+    count INTEGER NOT NULL,
+    total_time REAL NOT NULL,
+    last_timestamp TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS history_latency (
+    model TEXT NOT NULL,
+    bucket INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (model, bucket)
+);
+"""
+
+# Response times are counted in log-spaced buckets (~5% wide) so percentiles need no scan of the history
+BUCKETS_PER_E = 20
+
+
+def _bucket(response_time):
+    return round(math.log(max(response_time, 1e-3)) * BUCKETS_PER_E)
+
+
+def _bucket_value(bucket):
+    return math.exp(bucket / BUCKETS_PER_E)
+
+
+def _percentile(buckets, fraction):
+    """buckets: sorted [(bucket, count)]"""
+    total = sum(count for _, count in buckets)
+    if not total:
+        return 0.0
+    rank, seen = fraction * total, 0
+    for bucket, count in buckets:
+        seen += count
+        if seen >= rank:
+            return _bucket_value(bucket)
+    return _bucket_value(buckets[-1][0])
+
+
+class QueryHistory:
+    """
+    Append-only query history in SQLite, written off the request path.
+    record() only enqueues; a background thread inserts entries in batches
+    and, in the same transaction, updates per-model aggregates (count, total
+    time, latency histogram), so stats() never rereads the history. SQLite
+    WAL locking keeps concurrent writers in several processes safe.
+    """
+
+    def __init__(self, path="query_history.sqlite3", legacy_json_path="query_history.json"):
+        self.path = path
+        self._queue = queue.Queue()
+        conn = self._connect()
+        conn.executescript(SCHEMA)
+        conn.commit()
+        if legacy_json_path and os.path.exists(legacy_json_path):
+            self._import_legacy(conn, legacy_json_path)
+        conn.close()
+        self._writer = threading.Thread(target=self._write_loop, name="query-history-writer", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _import_legacy(self, conn, legacy_json_path):
+        """One-time import of the old read-modify-write JSON history into an empty database."""
+        # The write lock is taken before the emptiness check so concurrent processes import only once
+        conn.execute("BEGIN IMMEDIATE")
+        if conn.execute("SELECT COUNT(*) FROM history").fetchone()[0]:
+            conn.rollback()
+            return
+        try:
+            with open(legacy_json_path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+            for entry in entries:
+                self._insert(conn, entry)
+        except (OSError, ValueError, TypeError, KeyError, AttributeError) as e:
+            conn.rollback()
+            logger.warning(f"Skipped importing {legacy_json_path}: {str(e)}")
+            return
+        conn.commit()
+        logger.info(f"Imported {len(entries)} entries from {legacy_json_path}")
+
+    @staticmethod
+    def _insert(conn, entry):
+        model = entry.get("model", "unknown")
+        response_time = entry.get("response_time", 0.0)
+        conn.execute(
+            "INSERT INTO history (timestamp, question, answer, sources, response_time, model) VALUES (?, ?, ?, ?, ?, ?)",
+            (entry["timestamp"], entry["question"], entry["answer"],
+             json.dumps(entry.get("sources", []), ensure_ascii=False), response_time, model)
+        )
+        conn.execute(
+            "INSERT INTO history_stats (model, count, total_time, last_timestamp) VALUES (?, 1, ?, ?) "
+            "ON CONFLICT(model) DO UPDATE SET count = count + 1, total_time = total_time + excluded.total_time, "
+            "last_timestamp = MAX(last_timestamp, excluded.last_timestamp)",
+            (model, response_time, entry["timestamp"])
+        )
+        conn.execute(
+            "INSERT INTO history_latency (model, bucket, count) VALUES (?, ?, 1) "
+            "ON CONFLICT(model, bucket) DO UPDATE SET count = count + 1",
+            (model, _bucket(response_time))
+        )
+
+    def _write_loop(self):
+        conn = self._connect()
+        while True:
+            entry = self._queue.get()
+            batch = [entry]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            entries = [e for e in batch if e is not None]
+            try:
+                if entries:
+                    with conn:
+                        for e in entries:
+                            self._insert(conn, e)
+            except Exception as e:
+                logger.error(f"Failed to save query history: {str(e)}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if None in batch:
+                conn.close()
+                return
+
+    def record(self, entry):
+        """Queue one history entry ({"timestamp", "question", "answer", "sources", "response_time", "model"})."""
+        self._queue.put(entry)
+
+    def flush(self):
+        """Block until every queued entry has been written."""
+        self._queue.join()
+
+    def close(self):
+        if self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join()
+
+    def stats(self):
+        """Aggregates over the whole history: count, mean, p50/p95 response time and the same per model."""
+        conn = self._connect()
+        try:
+            totals = conn.execute("SELECT model, count, total_time, last_timestamp FROM history_stats").fetchall()
+            latency = conn.execute("SELECT model, bucket, count FROM history_latency ORDER BY bucket").fetchall()
+        finally:
+            conn.close()
+
+        def summarize(count, total_time, buckets):
+            return {
+                "count": count,
+                "mean": total_time / count if count else 0.0,
+                "p50": _percentile(buckets, 0.50),
+                "p95": _percentile(buckets, 0.95)
+            }
+
+        models = {}
+        for model, count, total_time, last_timestamp in totals:
+            buckets = [(bucket, n) for m, bucket, n in latency if m == model]
+            models[model] = dict(summarize(count, total_time, buckets), last_timestamp=last_timestamp)
+
+        merged = {}
+        for _, bucket, n in latency:
+            merged[bucket] = merged.get(bucket, 0) + n
+        overall = summarize(
+            sum(row[1] for row in totals),
+            sum(row[2] for row in totals),
+            sorted(merged.items())
+        )
+        overall["last_timestamp"] = max((row[3] for row in totals), default=None)
+        overall["models"] = models
+        return overall
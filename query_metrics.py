@@ -0,0 +1,196 @@
+import json
+import time
+import bisect
+import logging
+import threading
+import contextvars
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the histogram buckets: seconds for spans, counts for sizes
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, float("inf"))
+SIZE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250, 500, 1000, 2000, 4000, 8000, float("inf"))
+
+# Spans finished inside the current query; a contextvar so it follows asyncio.to_thread
+_trace = contextvars.ContextVar("raptor_trace", default=None)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.token = _trace.set([]) if _trace.get() is None else None
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.start
+        self.metrics.timing(self.name, seconds, **self.labels)
+        if self.token is not None:
+            trace = _trace.get()
+            _trace.reset(self.token)
+            self.metrics._finish_trace(self.name, seconds, trace)
+        return False
+
+
+class Metrics:
+    """
+    In-process span timers, counters and size histograms for the query path.
+    Disabled by default: span() then returns a shared no-op context manager and
+    count/observe/timing return immediately, so instrumented code costs a
+    function call. The outermost span of a query collects the spans finished
+    inside it; when it takes longer than `slow_query_seconds` the breakdown is
+    logged. Export with prometheus() (text format) or write_json().
+    With `keep_samples` every span duration is also kept in `samples`, for
+    exact percentiles in benchmarks; leave it off in long-running processes.
+    """
+
+    def __init__(self, enabled=False, slow_query_seconds=None, prefix="raptor"):
+        self.enabled = enabled
+        self.slow_query_seconds = slow_query_seconds
+        self.prefix = prefix
+        self.keep_samples = False
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.samples = {}
+
+    def enable(self, slow_query_seconds=None, keep_samples=False):
+        self.slow_query_seconds = slow_query_seconds
+        self.keep_samples = keep_samples
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+            self.samples.clear()
+
+    def span(self, name, **labels):
+        """Time a block as `name`; nested spans also land in the enclosing query's trace."""
+        if not self.enabled:
+            return _NOOP_SPAN
+        return Span(self, name, labels)
+
+    def count(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, buckets=SIZE_BUCKETS, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def timing(self, name, seconds, **labels):
+        """Record an already measured duration as span `name`, e.g. across a generator's lifetime."""
+        if not self.enabled:
+            return
+        self.observe("span_seconds", seconds, buckets=LATENCY_BUCKETS, span=name, **labels)
+        if self.keep_samples:
+            with self.lock:
+                self.samples.setdefault((name, tuple(sorted(labels.items()))), []).append(seconds)
+        trace = _trace.get()
+        if trace is not None:
+            trace.append((name, labels, seconds))
+
+    def _finish_trace(self, name, seconds, trace):
+        if self.slow_query_seconds is None or seconds < self.slow_query_seconds:
+            return
+        parts = []
+        for span_name, labels, span_seconds in trace[:-1]:
+            label_text = ",".join(f"{key}={value}" for key, value in labels.items())
+            parts.append(f"{span_name}{f'[{label_text}]' if label_text else ''} {span_seconds:.3f}s")
+        logger.warning(f"Slow {name} ({seconds:.2f} s): {', '.join(parts) or 'no inner spans'}")
+
+    def snapshot(self):
+        """Counters and histograms as plain data."""
+        with self.lock:
+            counters = [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in sorted(self.counters.items())
+            ]
+            histograms = [
+                {
+                    "name": name,
+                    "labels": dict(labels),
+                    "count": histogram.count,
+                    "sum": histogram.sum,
+                    "buckets": {("+Inf" if le == float("inf") else str(le)): n
+                                for le, n in zip(histogram.buckets, histogram.counts)},
+                }
+                for (name, labels), histogram in sorted(self.histograms.items())
+            ]
+        return {"counters": counters, "histograms": histograms}
+
+    def write_json(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(dict(self.snapshot(), timestamp=time.time()), f, indent=2)
+
+    def prometheus(self):
+        """Prometheus text exposition format (counters get a _total suffix, histograms are cumulative)."""
+        def label_text(labels, **extra):
+            pairs = list(labels.items()) + list(extra.items())
+            return "{" + ",".join(f'{key}="{value}"' for key, value in pairs) + "}" if pairs else ""
+
+        snapshot = self.snapshot()
+        lines, typed = [], set()
+        for counter in snapshot["counters"]:
+            name = f"{self.prefix}_{counter['name']}_total"
+            if name not in typed:
+                lines.append(f"# TYPE {name} counter")
+                typed.add(name)
+            lines.append(f"{name}{label_text(counter['labels'])} {counter['value']}")
+        for histogram in snapshot["histograms"]:
+            name = f"{self.prefix}_{histogram['name']}"
+            if name not in typed:
+                lines.append(f"# TYPE {name} histogram")
+                typed.add(name)
+            cumulative = 0
+            for le, n in histogram["buckets"].items():
+                cumulative += n
+                lines.append(f"{name}_bucket{label_text(histogram['labels'], le=le)} {cumulative}")
+            lines.append(f"{name}_sum{label_text(histogram['labels'])} {histogram['sum']}")
+            lines.append(f"{name}_count{label_text(histogram['labels'])} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+
+# Shared instance used across the query path; call metrics.enable() to start collecting
+metrics = Metrics()
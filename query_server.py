@@ -0,0 +1,277 @@
+import json
+import time
+import asyncio
+import logging
+import argparse
+import importlib
+import r6_retrieval_mechs as retrieval
+from query_metrics import metrics
+
+query_llm = importlib.import_module("7_query_llm")
+logger = logging.getLogger(__name__)
+
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+               413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable"}
+MAX_BODY_BYTES = 64 * 1024
+
+
+class EmbeddingBatcher:
+    """
+    Collects query embedding requests that arrive close together and sends
+    them to the embedder as a single embed_documents call: a batch is flushed
+    when it reaches `max_batch` texts or `max_wait` seconds after its first text.
+    """
+
+    def __init__(self, embed_documents, max_batch=16, max_wait=0.01, max_queue=256):
+        self.embed_documents = embed_documents
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.batches = 0
+        self.texts = 0
+
+    async def embed(self, text):
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((text, future))
+        return await future
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            texts = [text for text, _ in batch]
+            try:
+                vectors = await asyncio.to_thread(self.embed_documents, texts)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self.batches += 1
+            self.texts += len(texts)
+            metrics.count("embedder_calls")
+            for (_, future), vector in zip(batch, vectors):
+                if not future.done():
+                    future.set_result(vector)
+
+
+class QueryServer:
+    """
+    Asyncio HTTP front end for single_query semantics over one shared, warm retriever.
+
+    POST /query  {"question": str, "top_k_root"?: int, "top_k_children"?: int, "show_sources"?: bool}
+                 -> {"answer": str, "sources": [str], "response_time": float, "cached": bool}
+    GET  /health -> counters
+    GET  /metrics -> stage timings and counters in Prometheus text format
+
+    top_k_root / top_k_children must be positive integers. They only exist for the
+    tree descent, so with CONFIG["retrieval_mode"] == "collapsed" (which ranks
+    CONFIG["collapsed_top_k"] nodes) a request that sets them is rejected with 400.
+
+    Concurrent questions share batched embedder calls, at most
+    `max_generations` LLM calls run at once, and once `max_pending` requests
+    are in flight new ones are rejected with 503 + Retry-After (backpressure).
+    """
+
+    def __init__(self, host="127.0.0.1", port=8000, max_generations=2, max_pending=32,
+                 embed_batch_size=16, embed_batch_wait=0.01):
+        self.host = host
+        self.port = port
+        self.max_pending = max_pending
+        self.max_generations = max_generations
+        self.embed_batch_size = embed_batch_size
+        self.embed_batch_wait = embed_batch_wait
+        self.pending = 0
+        self.served = 0
+        self.rejected = 0
+
+    async def start(self):
+        retrieval.warm_up()
+        self.generation_slots = asyncio.Semaphore(self.max_generations)
+        self.batcher = EmbeddingBatcher(
+            retrieval.get_embeddings().embed_documents,
+            max_batch=self.embed_batch_size,
+            max_wait=self.embed_batch_wait
+        )
+        self._batcher_task = asyncio.create_task(self.batcher.run())
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        logger.info(f"Query server listening on http://{self.host}:{self.port}")
+        return self.server
+
+    async def serve_forever(self):
+        await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def answer(self, question, top_k_root=None, top_k_children=None, show_sources=True):
+        """single_query, with batched embedding and bounded generation."""
+        metrics.count("queries")
+        with metrics.span("query"):
+            return await self._answer(question, top_k_root, top_k_children, show_sources)
+
+    async def _answer(self, question, top_k_root, top_k_children, show_sources):
+        top_k_root = top_k_root or query_llm.CONFIG["default_top_k_root"]
+        top_k_children = top_k_children or query_llm.CONFIG["default_top_k_children"]
+        start_time = time.time()
+
+        query_vector = retrieval.cached_query_vector(question)
+        metrics.count("query_cache", result="hit" if query_vector is not None else "miss")
+        if query_vector is None:
+            with metrics.span("embed", batch="true"):
+                query_vector = await self.batcher.embed(question)
+            retrieval.cache_query_vector(question, query_vector)
+
+        cached = await asyncio.to_thread(
+            query_llm.lookup_answer, query_vector, top_k_root, top_k_children, show_sources
+        )
+        if cached:
+            answer, sources = cached["answer"], cached["sources"]
+        else:
+            results = await asyncio.to_thread(
+                query_llm.retrieve_context, question, top_k_root, top_k_children, query_vector
+            )
+            async with self.generation_slots:
+                answer, ok = await asyncio.to_thread(query_llm.generate_answer, question, results, show_sources)
+            sources = query_llm.query_sources(results)
+            await asyncio.to_thread(
+                query_llm.remember_answer, query_vector, top_k_root, top_k_children, show_sources, answer, results, ok
+            )
+
+        response_time = time.time() - start_time
+        query_llm.save_query_history(question, answer, sources, response_time)
+        return {"answer": answer, "sources": sources, "response_time": response_time, "cached": bool(cached)}
+
+    async def handle(self, reader, writer):
+        try:
+            status, payload, headers = await self._dispatch(reader)
+        except Exception as e:
+            logger.error(f"Query server error: {str(e)}")
+            status, payload, headers = 500, {"error": str(e)}, {}
+        if isinstance(payload, str):
+            body, content_type = payload.encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8"
+        else:
+            body, content_type = json.dumps(payload, ensure_ascii=False).encode("utf-8"), "application/json"
+        head = [f"HTTP/1.1 {status} {STATUS_TEXT[status]}", f"Content-Type: {content_type}",
+                f"Content-Length: {len(body)}", "Connection: close"]
+        head += [f"{key}: {value}" for key, value in headers.items()]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    @staticmethod
+    def _validate(request):
+        """Error message for a malformed /query body, or None."""
+        if not isinstance(request, dict) or not isinstance(request.get("question"), str):
+            return "expected a JSON body with a 'question' string"
+        if not request["question"].strip():
+            return "empty question"
+        for key in ("top_k_root", "top_k_children"):
+            value = request.get(key)
+            if value is None:
+                continue
+            if query_llm.CONFIG["retrieval_mode"] == "collapsed":
+                return f"'{key}' does not apply in collapsed retrieval mode"
+            if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+                return f"'{key}' must be a positive integer"
+        if not isinstance(request.get("show_sources", True), bool):
+            return "'show_sources' must be a boolean"
+        return None
+
+    async def _dispatch(self, reader):
+        request_line = (await reader.readline()).decode("latin-1").split()
+        if len(request_line) < 2:
+            return 400, {"error": "malformed request"}, {}
+        method, path = request_line[0], request_line[1]
+        length = 0
+        while True:
+            line = (await reader.readline()).decode("latin-1").strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            if name.strip().lower() == "content-length":
+                try:
+                    length = int(value.strip() or 0)
+                except ValueError:
+                    return 400, {"error": "invalid Content-Length"}, {}
+                if length < 0:
+                    return 400, {"error": "invalid Content-Length"}, {}
+
+        if path == "/health":
+            return 200, {"status": "ok", "pending": self.pending, "served": self.served,
+                         "rejected": self.rejected, "embed_batches": self.batcher.batches,
+                         "embedded_queries": self.batcher.texts,
+                         "answer_cache": query_llm.answer_cache.stats()}, {}
+        if path == "/metrics":
+            if not metrics.enabled:
+                return 404, {"error": "metrics are disabled; start with --metrics"}, {}
+            return 200, metrics.prometheus(), {}
+        if path != "/query":
+            return 404, {"error": f"unknown path {path}"}, {}
+        if method != "POST":
+            return 405, {"error": "use POST"}, {"Allow": "POST"}
+        if length > MAX_BODY_BYTES:
+            return 413, {"error": "request body too large"}, {}
+
+        try:
+            request = json.loads(await reader.readexactly(length))
+        except (ValueError, asyncio.IncompleteReadError):
+            return 400, {"error": "expected a JSON body with a 'question' string"}, {}
+        error = self._validate(request)
+        if error:
+            return 400, {"error": error}, {}
+        question = request["question"].strip()
+
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            return 503, {"error": "server busy, retry later"}, {"Retry-After": "1"}
+        self.pending += 1
+        try:
+            result = await self.answer(
+                question,
+                top_k_root=request.get("top_k_root"),
+                top_k_children=request.get("top_k_children"),
+                show_sources=request.get("show_sources", True)
+            )
+        finally:
+            self.pending -= 1
+        self.served += 1
+        return 200, result, {}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve RAPTOR RAG queries over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--max-generations", type=int, default=2, help="concurrent LLM generations")
+    parser.add_argument("--max-pending", type=int, default=32, help="in-flight requests before answering 503")
+    parser.add_argument("--embed-batch-size", type=int, default=16)
+    parser.add_argument("--embed-batch-wait", type=float, default=0.01, help="seconds to wait for a batch to fill")
+    parser.add_argument("--stub", action="store_true", help="use the offline stub embedder and LLM")
+    parser.add_argument("--metrics", action="store_true", help="collect stage timings and serve them on /metrics")
+    parser.add_argument("--slow-query-seconds", type=float, default=query_llm.CONFIG["slow_query_seconds"],
+                        help="log the stage breakdown of queries slower than this")
+    args = parser.parse_args()
+
+    if args.metrics:
+        metrics.enable(slow_query_seconds=args.slow_query_seconds)
+
+    if args.stub:
+        from local_backends import HashingEmbedder, StubChat
+        retrieval.set_embeddings(HashingEmbedder())
+        query_llm.chat_backend = StubChat()
+
+    server = QueryServer(args.host, args.port, args.max_generations, args.max_pending,
+                         args.embed_batch_size, args.embed_batch_wait)
+    asyncio.run(server.serve_forever())
@@ -1,66 +1,616 @@
-import json
-from langchain_ollama import OllamaEmbeddings
-from langchain_community.vectorstores import Chroma
+import threading
+from collections import OrderedDict
+import numpy as np
+from raptor_artifacts import ArtifactStore
+from query_metrics import metrics
+from vector_backends import open_backend
+from lexical_index import BM25Index
 import warnings
 warnings.filterwarnings("ignore")
 
-# Load vectorstore
-embeddings = OllamaEmbeddings(model="nomic-embed-text")
-vectorstore = Chroma(
-    persist_directory="./chroma_store",
-    embedding_function=embeddings
-)
+# langchain, the embedder and the vectorstore are only loaded on first use
+# (or by warm_up()), so importing this module stays cheap.
+EMBED_MODEL = "nomic-embed-text"
 
-# Load original summary tree (for hierarchy reference if needed)
-with open("./essentials/summary_tree.json", "r", encoding="utf-16") as f:
-    summary_tree = json.load(f)
+_embeddings = None
+_vectorstore = None
+_retriever = None
+_init_lock = threading.Lock()
 
 
-def raptor_retrieve(query, top_k_root=1, top_k_children=2):
+def get_embeddings():
+    global _embeddings
+    if _embeddings is None:
+        with _init_lock:
+            if _embeddings is None:
+                from langchain_ollama import OllamaEmbeddings
+                _embeddings = OllamaEmbeddings(model=EMBED_MODEL)
+    return _embeddings
+
+
+def get_vectorstore():
+    global _vectorstore
+    if _vectorstore is None:
+        embeddings = get_embeddings()
+        with _init_lock:
+            if _vectorstore is None:
+                # Chroma or the shared memory-mapped index, per vector_backends.VECTOR_BACKEND
+                _vectorstore = open_backend(embeddings)
+    return _vectorstore
+
+
+def set_embeddings(embeddings):
+    """Swap the query embedder (e.g. local_backends.HashingEmbedder for offline runs) and drop cached vectors."""
+    global _embeddings
+    with _init_lock:
+        _embeddings = embeddings
+    with _query_cache_lock:
+        _query_cache.clear()
+
+
+# LRU cache of query embeddings, keyed by normalized query text
+QUERY_CACHE_SIZE = 256
+_query_cache = OrderedDict()
+_query_cache_lock = threading.Lock()
+
+
+def normalize_query(query):
+    """Collapse whitespace and case so trivially different questions share a cache entry."""
+    return " ".join(query.split()).lower()
+
+
+def cached_query_vector(query):
+    """Return the cached embedding of `query`, or None."""
+    key = normalize_query(query)
+    with _query_cache_lock:
+        if key not in _query_cache:
+            return None
+        _query_cache.move_to_end(key)
+        return _query_cache[key]
+
+
+def cache_query_vector(query, vector):
+    with _query_cache_lock:
+        _query_cache[normalize_query(query)] = vector
+        if len(_query_cache) > QUERY_CACHE_SIZE:
+            _query_cache.popitem(last=False)
+
+
+def embed_query(query):
+    """
+    Embed a query once, serving repeats from the LRU cache.
+    """
+    vector = cached_query_vector(query)
+    metrics.count("query_cache", result="hit" if vector is not None else "miss")
+    if vector is None:
+        metrics.count("embedder_calls")
+        with metrics.span("embed"):
+            vector = get_embeddings().embed_query(query)
+        cache_query_vector(query, vector)
+    return vector
+
+
+def embed_queries(queries):
+    """
+    Embed many queries with a single embedder call for those not in the LRU cache.
+    """
+    vectors = [cached_query_vector(query) for query in queries]
+    missing = {}
+    for query, vector in zip(queries, vectors):
+        if vector is None:
+            missing.setdefault(normalize_query(query), query)
+    metrics.count("query_cache", len(queries) - len(missing), result="hit")
+    if not missing:
+        return vectors
+
+    metrics.count("query_cache", len(missing), result="miss")
+    metrics.count("embedder_calls")
+    with metrics.span("embed", batch="true"):
+        embedded = dict(zip(missing, get_embeddings().embed_documents(list(missing.values()))))
+    for key, query in missing.items():
+        cache_query_vector(query, embedded[key])
+    return [embedded[normalize_query(query)] if vector is None else vector for query, vector in zip(queries, vectors)]
+
+
+def _normalize_rows(vectors):
+    matrix = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _similarities(queries, matrix):
+    """
+    Cosine scores of normalized query rows against normalized node rows.
+    BLAS results for one (query, node) pair depend on the shape of the whole
+    product, so scores are accumulated in float64 and rounded to float32:
+    a query then gets the same scores alone or inside a batch.
+    """
+    return (queries.astype(np.float64) @ matrix.astype(np.float64).T).astype(np.float32)
+
+
+class TreeIndex:
     """
-    Perform RAPTOR-style hierarchical retrieval.
+    In-process view of the RAPTOR tree, built from the artifact store and the
+    embeddings already stored in the vector backend.
+    Holds the parent->children adjacency, the root nodes of every file and one
+    contiguous, L2-normalized embedding matrix per level, so scoring a set of
+    children is a single gather + dot product instead of a filtered store query.
+    Node text is not kept in memory; it is read from the artifact store for
+    the nodes actually returned. With the memmap backend the matrix is a
+    slice of the backend's shared map rather than a private copy.
     """
 
-    root_level_map = {}
-    for file_id, file_data in summary_tree.items():
-        levels = list(file_data["levels"].keys())
-        max_level = max(levels, key=lambda x: int(x.split("_")[1]))
-        for chunk in file_data["levels"][max_level]:
-            root_level_map[chunk["id"]] = int(max_level.split("_")[1])
+    def __init__(self, vectorstore, store):
+        self.vectorstore = vectorstore
+        self.store = store
+        self.file_digests = {}
+        self.file_nodes = {}
+        self.children = {}
+        self.level_of = {}
+        self.root_levels = {}
+        self.root_ids = []
+        self.vectors = {}
+        self.metadata = {}
+        self.level_ids = {}
+        self.position = {}
+        self.matrices = {}
+        self.all_ids = []
+        self.all_levels = np.empty(0, dtype=np.int32)
+        self.all_matrix = np.empty((0, 0), dtype=np.float32)
+
+    def copy(self):
+        """
+        Copy for copy-on-write updates: the mappings update() edits in place are
+        duplicated, while vectors, lists and matrices (only ever replaced) are shared.
+        """
+        index = TreeIndex(self.vectorstore, self.store)
+        for name in ("file_digests", "file_nodes", "children", "level_of", "root_levels", "vectors", "metadata"):
+            setattr(index, name, dict(getattr(self, name)))
+        for name in ("root_ids", "level_ids", "position", "matrices", "all_ids", "all_levels", "all_matrix"):
+            setattr(index, name, getattr(self, name))
+        return index
 
-    root_ids = list(root_level_map.keys())
+    def update(self, digests):
+        """
+        Sync the index with the per-file `digests` of the artifact store,
+        reloading structure and embeddings only for files whose content changed.
+        Returns the ids of the files that were reloaded.
+        """
+        changed = [file_id for file_id in self.file_digests if file_id not in digests]
+        for file_id in changed:
+            self._drop_file(file_id)
+
+        stale = []
+        for file_id, digest in digests.items():
+            if self.file_digests.get(file_id) != digest:
+                self._drop_file(file_id)
+                self._add_file(file_id)
+                self.file_digests[file_id] = digest
+                stale.append(file_id)
+
+        if stale:
+            self._load_embeddings(stale)
+        if changed or stale:
+            self.root_ids = list(self.root_levels)
+            self._rebuild_matrices()
+        return changed + stale
+
+    def _add_file(self, file_id):
+        structure = self.store.structure(file_id)
+        max_level = max((level_num for _, level_num, _ in structure), default=0)
+        nodes = []
+        for node_id, level_num, source in structure:
+            nodes.append(node_id)
+            self.level_of[node_id] = level_num
+            if level_num > 0:
+                self.children[node_id] = list(source)
+            if level_num == max_level:
+                self.root_levels[node_id] = level_num
+        self.file_nodes[file_id] = nodes
+
+    def _drop_file(self, file_id):
+        for node_id in self.file_nodes.pop(file_id, []):
+            for mapping in (self.children, self.level_of, self.root_levels, self.vectors, self.metadata):
+                mapping.pop(node_id, None)
+        self.file_digests.pop(file_id, None)
+
+    def _load_embeddings(self, file_ids):
+        metrics.count("store_calls", store="vectorstore")
+        stored = self.vectorstore.get(
+            where={"file_id": {"$in": file_ids}},
+            include=["embeddings", "metadatas"]
+        )
+        for node_id, vector, metadata in zip(stored["ids"], stored["embeddings"], stored["metadatas"]):
+            node_id = metadata.get("id", node_id)
+            if node_id not in self.level_of:
+                continue
+            self.vectors[node_id] = np.asarray(vector, dtype=np.float32)  # normalized in _rebuild_matrices
+            self.metadata[node_id] = metadata
 
-    root_results = vectorstore.similarity_search(
-        query,
-        k=top_k_root,
-        filter={"id": {"$in": root_ids}}
-    )
+    def _rebuild_matrices(self):
+        level_vectors = {}
+        self.level_ids = {}
+        self.position = {}
+        items = self.vectors.items()
+        row_of = getattr(self.vectorstore, "row_of", None)
+        if row_of is not None:
+            # Follow the backend's row order so a level can map onto a contiguous slice of it
+            items = sorted(items, key=lambda item: row_of.get(item[0], len(row_of)))
+        for node_id, vector in items:
+            level_num = self.level_of[node_id]
+            ids = self.level_ids.setdefault(level_num, [])
+            self.position[node_id] = (level_num, len(ids))
+            ids.append(node_id)
+            level_vectors.setdefault(level_num, []).append(vector)
 
-    def descend(children):
-        if all(cid.endswith("level_0") for cid in children):
-            child_results = vectorstore.similarity_search(
-                query,
-                k=len(children),
-                filter={"id": {"$in": children}}
+        # One matrix of every node ordered by level; the per-level matrices are contiguous views into it
+        levels = sorted(level_vectors)
+        self.all_ids = [node_id for level_num in levels for node_id in self.level_ids[level_num]]
+        self.all_levels = np.array([self.level_of[node_id] for node_id in self.all_ids], dtype=np.int32)
+        shared_matrix = getattr(self.vectorstore, "shared_matrix", None)
+        self.all_matrix = shared_matrix(self.all_ids) if shared_matrix else None
+        if self.all_matrix is None:
+            self.all_matrix = (
+                np.ascontiguousarray(np.vstack([np.vstack(level_vectors[level_num]) for level_num in levels]))
+                if levels else np.empty((0, 0), dtype=np.float32)
             )
-            return child_results
-        
-        child_results = vectorstore.similarity_search(
-            query,
-            k=min(top_k_children, len(children)),
-            filter={"id": {"$in": children}}
+            norms = np.linalg.norm(self.all_matrix, axis=1, keepdims=True)
+            self.all_matrix /= np.where(norms == 0, 1.0, norms)
+        self.matrices = {}
+        start = 0
+        for level_num in levels:
+            end = start + len(self.level_ids[level_num])
+            self.matrices[level_num] = self.all_matrix[start:end]
+            start = end
+
+    def rank_batch(self, queries, candidate_lists, ks):
+        """
+        For each normalized query row, rank its own candidate ids and keep the top k.
+        All queries are scored against the union of their candidates with one
+        matrix-matrix product per level. Nodes missing from the store are
+        skipped, like an unmatched `$in` filter.
+        Returns: [(node_ids, scores)] per query
+        """
+        per_query, columns = [], {}
+        for ids in candidate_lists:
+            by_level = {}
+            for node_id in dict.fromkeys(ids):
+                if node_id in self.position:
+                    level_num = self.position[node_id][0]
+                    by_level.setdefault(level_num, []).append(node_id)
+                    level_columns = columns.setdefault(level_num, {})
+                    level_columns.setdefault(node_id, len(level_columns))
+            per_query.append(by_level)
+
+        level_scores = {
+            level_num: _similarities(queries, self.matrices[level_num][[self.position[n][1] for n in level_columns]])
+            for level_num, level_columns in columns.items()
+        }
+
+        results = []
+        for q, (by_level, k) in enumerate(zip(per_query, ks)):
+            if not by_level or k <= 0:
+                results.append(([], []))
+                continue
+            candidate_ids, scores = [], []
+            for level_num, level_ids in by_level.items():
+                candidate_ids.extend(level_ids)
+                scores.append(level_scores[level_num][q, [columns[level_num][n] for n in level_ids]])
+            scores = np.concatenate(scores)
+            order = np.argsort(-scores, kind="stable")[:k]
+            results.append(([candidate_ids[i] for i in order], [float(scores[i]) for i in order]))
+        return results
+
+    def rank(self, query_vector, ids, k):
+        """
+        Return the k Documents among `ids` most similar to the query vector.
+        """
+        node_ids, scores = self.rank_batch(_normalize_rows([query_vector]), [ids], [k])[0]
+        return self.documents(node_ids, scores)
+
+    def top_k(self, query_vector, k, level_weights=None):
+        """
+        Collapsed-tree search: score every node of every level in one matrix-vector
+        product and return the k best Documents. `level_weights` ({level: weight},
+        default 1.0) scales each level's cosine similarity before ranking.
+        """
+        if not self.all_ids or k <= 0:
+            return []
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+
+        scores = self.all_matrix @ query
+        if level_weights:
+            weights = np.array([level_weights.get(level_num, 1.0) for level_num in range(self.all_levels.max() + 1)],
+                               dtype=np.float32)
+            scores = scores * weights[self.all_levels]
+
+        k = min(k, len(self.all_ids))
+        candidates = np.argpartition(-scores, k - 1)[:k]
+        order = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return self.documents([self.all_ids[i] for i in order], [float(scores[i]) for i in order])
+
+    def documents(self, node_ids, scores):
+        """
+        Materialize Documents in the given order: text from the artifact store,
+        metadata from the vector backend plus the cosine similarity `score` to the query.
+        """
+        from langchain_core.documents import Document
+        metrics.count("store_calls", store="artifacts")
+        texts = self.store.texts(node_ids)
+        return [
+            Document(page_content=texts[node_id], metadata=dict(self.metadata[node_id], score=score))
+            for node_id, score in zip(node_ids, scores)
+        ]
+
+
+class RaptorRetriever:
+    """
+    Retrieval engine built once per process.
+    Owns the tree index (root ids, level metadata, parent/child maps) and
+    reloads it when the artifact store or the vector backend changes on disk:
+    a cheap mtime check first, then a diff of the per-file content digests so
+    only changed files are reloaded and refetched from the vectorstore. A
+    backend change (stage 5 re-embedding nodes under the same ids) reloads
+    every vector.
+
+    Reloads never touch the index in use: the new one is built off to the
+    side and swapped in with a single assignment, so retrievals running on
+    other threads always read one complete index.
+    """
+
+    def __init__(self, vectorstore, store):
+        self.store = store
+        self.vectorstore = vectorstore
+        self.index = TreeIndex(vectorstore, store)
+        self.lexical = None
+        self._lexical_mtime = None
+        self._lexical_digest = None
+        self._lexical_lock = threading.Lock()
+        self._version = None
+        self._lock = threading.Lock()
+        self.refresh()
+
+    def _current_version(self):
+        backend_version = getattr(self.vectorstore, "version", None)
+        return self.store.mtime(), backend_version() if backend_version else None
+
+    def refresh(self):
+        """Reload if the store or the backend was modified since the last check. Returns True on reload."""
+        version = self._current_version()
+        if version == self._version:
+            return False
+
+        with self._lock:
+            if version == self._version:
+                return False
+            backend_changed = self._version is None or version[1] != self._version[1]
+            index = TreeIndex(self.vectorstore, self.store) if backend_changed else self.index.copy()
+            changed = index.update(self.store.digests())
+            self.index = index
+            self._version = version
+            return bool(changed)
+
+    def retrieve(self, query, top_k_root=1, top_k_children=2, query_vector=None):
+        """
+        Perform RAPTOR-style hierarchical retrieval.
+        The query is embedded once (unless `query_vector` is supplied) and the
+        vector is reused for every level; root and child scoring run against
+        the in-memory tree index.
+        """
+        query_vectors = None if query_vector is None else [query_vector]
+        return self.retrieve_batch([query], top_k_root, top_k_children, query_vectors=query_vectors)[0]
+
+    def retrieve_batch(self, queries, top_k_root=1, top_k_children=2, query_vectors=None):
+        """
+        RAPTOR descent for many queries at once. All queries are embedded in one
+        embedder call, then every level of the descent scores all still-active
+        queries with matrix-matrix products. retrieve() is this with one query,
+        so per-query results are identical to the single-query path.
+        """
+        self.refresh()
+        index = self.index
+        if query_vectors is None:
+            query_vectors = embed_queries(queries)
+        vectors = _normalize_rows(query_vectors)
+
+        def expand(node_ids):
+            return [child for node_id in node_ids for child in index.children.get(node_id, [])]
+
+        with metrics.span("search", depth="0"):
+            roots = index.rank_batch(vectors, [index.root_ids] * len(queries), [top_k_root] * len(queries))
+        frontier = [expand(node_ids) for node_ids, _ in roots]
+        results = [None] * len(queries)
+
+        active = list(range(len(queries)))
+        depth = 1
+        while active:
+            at_leaves = {i: all(cid.endswith("level_0") for cid in frontier[i]) for i in active}
+            ks = [len(frontier[i]) if at_leaves[i] else min(top_k_children, len(frontier[i])) for i in active]
+            with metrics.span("search", depth=str(depth)):
+                ranked = index.rank_batch(vectors[active], [frontier[i] for i in active], ks)
+            depth += 1
+
+            still_descending = []
+            for i, (node_ids, scores) in zip(active, ranked):
+                if at_leaves[i]:
+                    results[i] = (node_ids, scores)
+                else:
+                    frontier[i] = expand(node_ids)
+                    still_descending.append(i)
+            active = still_descending
+
+        for node_ids, _ in results:
+            metrics.observe("retrieved_chunks", len(node_ids), mode="tree")
+        return [index.documents(node_ids, scores) for node_ids, scores in results]
+
+    def lexical_index(self):
+        """
+        The BM25 index, loaded on the first hybrid query. After the store changes
+        it is rebuilt only if the level-0 chunks did (summaries do not affect it).
+        Hybrid retrieval skips lexical hits the tree index does not know, so the
+        two may be swapped separately.
+        """
+        mtime = self.store.mtime()
+        if mtime == self._lexical_mtime:
+            return self.lexical
+        with self._lexical_lock:
+            if mtime == self._lexical_mtime:
+                return self.lexical
+            digest = self.store.level_digest(0)
+            if digest != self._lexical_digest:
+                self.lexical = BM25Index.from_store(self.store)
+                self._lexical_digest = digest
+            self._lexical_mtime = mtime
+            return self.lexical
+
+    def retrieve_hybrid(self, query, top_k_root=1, top_k_children=2, lexical_k=10, rrf_k=60, query_vector=None):
+        """
+        Tree descent fused with BM25 over the level-0 chunks by reciprocal rank
+        fusion: every chunk scores sum(1 / (rrf_k + rank)) over the rankings it
+        appears in. Exact identifiers found lexically can displace descent hits
+        even when the descent missed their subtree, but the result is capped at
+        the descent's own size, so hybrid sends the LLM no more chunks than tree
+        mode. metadata['score'] is the fused score, with the cosine similarity
+        in 'vector_score' and BM25 in 'bm25_score'.
+        """
+        if query_vector is None:
+            query_vector = embed_query(query)
+        vector_docs = self.retrieve(query, top_k_root, top_k_children, query_vector=query_vector)
+        index, lexical = self.index, self.lexical_index()
+        with metrics.span("search", depth="lexical"):
+            lexical_hits = lexical.search(query, lexical_k) if lexical is not None else []
+
+        fused = {}
+        for rank, doc in enumerate(vector_docs):
+            fused[doc.metadata["id"]] = 1.0 / (rrf_k + rank + 1)
+        bm25 = {}
+        for rank, (node_id, score) in enumerate(lexical_hits):
+            if node_id not in index.position:
+                continue  # chunk not embedded yet
+            bm25[node_id] = score
+            fused[node_id] = fused.get(node_id, 0.0) + 1.0 / (rrf_k + rank + 1)
+
+        # Ties keep the descent's order; keep as many chunks as the descent returned
+        ranked = sorted(fused, key=fused.get, reverse=True)[:len(vector_docs)]
+        docs = {doc.metadata["id"]: doc for doc in vector_docs}
+        missing = [node_id for node_id in ranked if node_id not in docs]
+        if missing:
+            node_ids, scores = index.rank_batch(_normalize_rows([query_vector]), [missing], [len(missing)])[0]
+            docs.update(zip(node_ids, index.documents(node_ids, scores)))
+
+        results = []
+        for node_id in ranked:
+            doc = docs[node_id]
+            doc.metadata.update(vector_score=doc.metadata["score"], bm25_score=bm25.get(node_id, 0.0),
+                                score=fused[node_id])
+            results.append(doc)
+        metrics.observe("retrieved_chunks", len(results), mode="hybrid")
+        return results
+
+    def retrieve_collapsed(self, query, top_k=10, level_weights=None, query_vector=None):
+        """
+        RAPTOR "collapsed tree" retrieval: a single vectorized top-k over the
+        nodes of all levels at once, returning the same Document shape as
+        retrieve(). metadata['score'] is the level-weighted similarity.
+        """
+        self.refresh()
+        if query_vector is None:
+            query_vector = embed_query(query)
+        with metrics.span("search", depth="collapsed"):
+            docs = self.index.top_k(query_vector, top_k, level_weights=level_weights)
+        metrics.observe("retrieved_chunks", len(docs), mode="collapsed")
+        return docs
+
+
+def get_retriever():
+    """Shared retriever, built on first use."""
+    global _retriever
+    if _retriever is None:
+        vectorstore = get_vectorstore()
+        with _init_lock:
+            if _retriever is None:
+                _retriever = RaptorRetriever(vectorstore, ArtifactStore(readonly=True))
+    return _retriever
+
+
+def raptor_retrieve_batch(queries, top_k_root=1, top_k_children=2, query_vectors=None):
+    """
+    Batched RAPTOR retrieval with the shared retriever: one embedder call for
+    all queries and matrix-matrix scoring per level. Returns one result list
+    per query, identical to calling raptor_retrieve on each.
+    """
+    with metrics.span("retrieve", mode="tree_batch"):
+        return get_retriever().retrieve_batch(
+            list(queries), top_k_root=top_k_root, top_k_children=top_k_children, query_vectors=query_vectors
         )
-        next_children = []
-        for doc in child_results:
-            next_children.extend(json.loads(doc.metadata["chunk_source"]))
-        return descend(next_children)
 
-    children = []
-    for doc in root_results:
-        children.extend(json.loads(doc.metadata["chunk_source"]))
-    
-    return descend(children)
+
+def hybrid_retrieve(query, top_k_root=1, top_k_children=2, lexical_k=10, rrf_k=60, query_vector=None):
+    """
+    Tree retrieval fused with BM25 lexical search, with the shared retriever.
+    """
+    with metrics.span("retrieve", mode="hybrid"):
+        return get_retriever().retrieve_hybrid(
+            query, top_k_root=top_k_root, top_k_children=top_k_children,
+            lexical_k=lexical_k, rrf_k=rrf_k, query_vector=query_vector
+        )
+
+
+def collapsed_retrieve(query, top_k=10, level_weights=None, query_vector=None):
+    """
+    Collapsed-tree retrieval with the shared retriever.
+    """
+    with metrics.span("retrieve", mode="collapsed"):
+        return get_retriever().retrieve_collapsed(
+            query, top_k=top_k, level_weights=level_weights, query_vector=query_vector
+        )
+
+
+def context_fingerprint(docs):
+    """
+    Content digests of the tree files the documents were retrieved from.
+    Any rebuild of one of those files changes its digest.
+    """
+    retriever = get_retriever()
+    retriever.refresh()
+    digests = retriever.index.file_digests
+    return {doc.metadata["file_id"]: digests.get(doc.metadata["file_id"]) for doc in docs}
+
+
+def fingerprint_is_current(fingerprint):
+    retriever = get_retriever()
+    retriever.refresh()
+    digests = retriever.index.file_digests
+    return all(digests.get(file_id) == digest for file_id, digest in fingerprint.items())
+
+
+def warm_up(load_embedder=True):
+    """
+    Initialize everything up front instead of on the first query: langchain
+    imports, the vectorstore, the tree index and, optionally, the embedding
+    model inside Ollama (with a throwaway embedding that bypasses the cache).
+    """
+    retriever = get_retriever()
+    if load_embedder:
+        get_embeddings().embed_query("warm up")
+    return retriever
+
+
+def raptor_retrieve(query, top_k_root=1, top_k_children=2, query_vector=None):
+    """
+    Perform RAPTOR-style hierarchical retrieval with the shared retriever.
+    """
+    with metrics.span("retrieve", mode="tree"):
+        return get_retriever().retrieve(
+            query, top_k_root=top_k_root, top_k_children=top_k_children, query_vector=query_vector
+        )
 
 
-query = "How does the SphygmoCor XCEL measure blood pressure?"
-results = raptor_retrieve(query)
+if __name__ == "__main__":
+    query = "How does the SphygmoCor XCEL measure blood pressure?"
+    for mode, retrieve in (("tree", raptor_retrieve), ("collapsed", collapsed_retrieve), ("hybrid", hybrid_retrieve)):
+        print(f"--- {mode} ---")
+        for doc in retrieve(query):
+            print(f"[{doc.metadata['id']}] {doc.page_content[:100]}...")
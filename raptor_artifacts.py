@@ -0,0 +1,256 @@
+import os
+import json
+import hashlib
+import sqlite3
+import threading
+
+ARTIFACT_PATH = "./essentials/raptor.sqlite3"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    position INTEGER PRIMARY KEY,
+    source TEXT NOT NULL,
+    text TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS files (
+    file_id TEXT PRIMARY KEY,
+    position INTEGER NOT NULL,
+    source TEXT NOT NULL,
+    digest TEXT NOT NULL DEFAULT ''
+);
+CREATE TABLE IF NOT EXISTS nodes (
+    id TEXT PRIMARY KEY,
+    file_id TEXT NOT NULL,
+    level INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    source TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS nodes_file_level ON nodes(file_id, level, position);
+CREATE INDEX IF NOT EXISTS nodes_level ON nodes(level);
+CREATE TABLE IF NOT EXISTS lexical_docs (
+    row INTEGER PRIMARY KEY,
+    id TEXT NOT NULL,
+    length INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS lexical_terms (
+    term TEXT PRIMARY KEY,
+    rows BLOB NOT NULL,
+    tfs BLOB NOT NULL
+);
+"""
+
+
+class ArtifactStore:
+    """
+    Compact SQLite replacement for group_chunks.json and summary_tree.json.
+    Nodes are indexed by id and by (file, level), so consumers read one file,
+    one level or a handful of node texts without parsing the whole corpus.
+    Each file carries a digest of its nodes that changes whenever the file's
+    subtree is rewritten, which lets long-running readers reload incrementally.
+    """
+
+    def __init__(self, path=ARTIFACT_PATH, readonly=False):
+        """`readonly` (the query path) skips creating missing tables, so reading never rewrites the database."""
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        if not readonly:
+            self._conn.executescript(SCHEMA)
+            self._conn.commit()
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _iter_query(self, sql, params=(), batch_size=512):
+        """Stream rows in batches, taking the lock per batch so other readers are not held up."""
+        with self._lock:
+            cursor = self._conn.execute(sql, params)
+        while True:
+            with self._lock:
+                rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            yield from rows
+
+    def mtime(self):
+        """Latest modification time of the database, including uncheckpointed WAL writes."""
+        paths = [self.path, self.path + "-wal"]
+        return max(os.stat(p).st_mtime_ns for p in paths if os.path.exists(p))
+
+    # Grouped corpus (stage 2 -> 3)
+
+    def save_documents(self, documents):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM documents")
+            self._conn.executemany(
+                "INSERT INTO documents (position, source, text) VALUES (?, ?, ?)",
+                [(i, doc["source"], doc["text"]) for i, doc in enumerate(documents)]
+            )
+
+    def iter_documents(self):
+        for source, text in self._query("SELECT source, text FROM documents ORDER BY position"):
+            yield {"text": text, "source": source}
+
+    # Summary tree (stages 3 -> 4 -> 5 and retrieval)
+
+    def save_tree(self, tree):
+        """Replace the whole tree with a dict shaped like summary_tree.json."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM nodes")
+            self._conn.execute("DELETE FROM files")
+            for position, (file_id, file_data) in enumerate(tree.items()):
+                self._conn.execute(
+                    "INSERT INTO files (file_id, position, source) VALUES (?, ?, ?)",
+                    (file_id, position, file_data["source"])
+                )
+                for level_name, chunks in file_data["levels"].items():
+                    self._insert_level(file_id, int(level_name.split("_")[1]), chunks)
+                self._update_digest(file_id)
+
+    def put_level(self, file_id, level, chunks):
+        """Replace a single level of one file."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM nodes WHERE file_id = ? AND level = ?", (file_id, level))
+            self._insert_level(file_id, level, chunks)
+            self._update_digest(file_id)
+
+    def _insert_level(self, file_id, level, chunks):
+        self._conn.executemany(
+            "INSERT INTO nodes (id, file_id, level, position, text, source) VALUES (?, ?, ?, ?, ?, ?)",
+            [
+                (chunk["id"], file_id, level, i, chunk["text"], json.dumps(chunk["source"], ensure_ascii=False))
+                for i, chunk in enumerate(chunks)
+            ]
+        )
+
+    def _update_digest(self, file_id):
+        digest = hashlib.sha256()
+        rows = self._conn.execute(
+            "SELECT id, level, text, source FROM nodes WHERE file_id = ? ORDER BY level, position", (file_id,)
+        )
+        for row in rows:
+            digest.update(json.dumps(row, ensure_ascii=False).encode("utf-8"))
+        self._conn.execute("UPDATE files SET digest = ? WHERE file_id = ?", (digest.hexdigest(), file_id))
+
+    def file_ids(self):
+        return [row[0] for row in self._query("SELECT file_id FROM files ORDER BY position")]
+
+    def digests(self):
+        return dict(self._query("SELECT file_id, digest FROM files"))
+
+    def level(self, file_id, level):
+        rows = self._query(
+            "SELECT id, text, source FROM nodes WHERE file_id = ? AND level = ? ORDER BY position",
+            (file_id, level)
+        )
+        return [{"id": node_id, "text": text, "source": json.loads(source)} for node_id, text, source in rows]
+
+    def load_file(self, file_id):
+        """One file in summary_tree.json shape: {"levels": {"level_0": [...], ...}, "source": str}"""
+        source = self._query("SELECT source FROM files WHERE file_id = ?", (file_id,))[0][0]
+        levels = [row[0] for row in self._query(
+            "SELECT DISTINCT level FROM nodes WHERE file_id = ? ORDER BY level", (file_id,)
+        )]
+        return {"levels": {f"level_{n}": self.level(file_id, n) for n in levels}, "source": source}
+
+    def load_tree(self):
+        return {file_id: self.load_file(file_id) for file_id in self.file_ids()}
+
+    def structure(self, file_id):
+        """Text-free view of one file: [(node_id, level, source)] with source decoded."""
+        rows = self._query(
+            "SELECT id, level, source FROM nodes WHERE file_id = ? ORDER BY level, position", (file_id,)
+        )
+        return [(node_id, level, json.loads(source)) for node_id, level, source in rows]
+
+    def iter_nodes(self):
+        """Yields (file_id, level, node) for every node, file by file and level by level."""
+        for file_id in self.file_ids():
+            rows = self._query(
+                "SELECT id, level, text, source FROM nodes WHERE file_id = ? ORDER BY level, position", (file_id,)
+            )
+            for node_id, level, text, source in rows:
+                yield file_id, level, {"id": node_id, "text": text, "source": json.loads(source)}
+
+    def texts(self, node_ids):
+        node_ids = list(node_ids)
+        if not node_ids:
+            return {}
+        placeholders = ",".join("?" * len(node_ids))
+        return dict(self._query(f"SELECT id, text FROM nodes WHERE id IN ({placeholders})", node_ids))
+
+    def iter_level(self, level):
+        """Yields (node_id, text) for every node of one level across all files, without loading the others."""
+        yield from self._iter_query("SELECT id, text FROM nodes WHERE level = ? ORDER BY file_id, position", (level,))
+
+    def level_digest(self, level):
+        """Digest of one level's ids and texts across all files; rows are hashed as they are read."""
+        digest = hashlib.sha256()
+        for node_id, text in self.iter_level(level):
+            digest.update(f"{node_id}\0{text}\0".encode("utf-8"))
+        return digest.hexdigest()
+
+    # Lexical (BM25) index over level-0 chunks (stage 3 -> retrieval)
+
+    def save_lexical_index(self, docs, terms):
+        """Replace the lexical index: docs [(node_id, length)] by row, terms [(term, rows blob, tfs blob)]."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM lexical_docs")
+            self._conn.execute("DELETE FROM lexical_terms")
+            self._conn.executemany(
+                "INSERT INTO lexical_docs (row, id, length) VALUES (?, ?, ?)",
+                [(row, node_id, length) for row, (node_id, length) in enumerate(docs)]
+            )
+            self._conn.executemany("INSERT INTO lexical_terms (term, rows, tfs) VALUES (?, ?, ?)", terms)
+
+    def load_lexical_index(self):
+        """Saved (docs, terms), both empty when none was saved or the database predates the lexical tables."""
+        if not self._query("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'lexical_docs'"):
+            return [], []
+        docs = self._query("SELECT id, length FROM lexical_docs ORDER BY row")
+        terms = self._query("SELECT term, rows, tfs FROM lexical_terms")
+        return docs, terms
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def convert_legacy(store, essentials_dir="./essentials", extracted_dir="./data/extracted_pdfs"):
+    """
+    Import the old pretty-printed UTF-16 JSON intermediates:
+    group_chunks.json and summary_tree.json into the artifact store, and
+    data/extracted_pdfs/*.json into JSON Lines next to them.
+    """
+    group_path = os.path.join(essentials_dir, "group_chunks.json")
+    if os.path.exists(group_path):
+        with open(group_path, "r", encoding="utf-16") as f:
+            store.save_documents(json.load(f))
+        print(f"✅ Imported {group_path}")
+
+    tree_path = os.path.join(essentials_dir, "summary_tree.json")
+    if os.path.exists(tree_path):
+        with open(tree_path, "r", encoding="utf-16") as f:
+            store.save_tree(json.load(f))
+        print(f"✅ Imported {tree_path}")
+
+    if os.path.isdir(extracted_dir):
+        for name in sorted(os.listdir(extracted_dir)):
+            if not name.endswith(".json"):
+                continue
+            with open(os.path.join(extracted_dir, name), "r", encoding="utf-16") as f:
+                pages = json.load(f)
+            with open(os.path.join(extracted_dir, name + "l"), "w", encoding="utf-8") as out_f:
+                for page in pages:
+                    out_f.write(json.dumps(page, ensure_ascii=False) + "\n")
+            print(f"✅ Converted {name} -> {name}l")
+
+
+if __name__ == "__main__":
+    store = ArtifactStore()
+    convert_legacy(store)
+    store.close()
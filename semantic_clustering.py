@@ -0,0 +1,90 @@
+import numpy as np
+
+
+def reduce_dimensions(vectors, n_components):
+    """Project rows onto their top `n_components` principal components (PCA via SVD)."""
+    centered = vectors - vectors.mean(axis=0)
+    if n_components >= min(centered.shape):
+        return centered
+    _, _, vt = np.linalg.svd(centered, full_matrices=False)
+    return centered @ vt[:n_components].T
+
+
+def _squared_distances(points, centroids):
+    distances = (points ** 2).sum(axis=1)[:, None] - 2 * points @ centroids.T + (centroids ** 2).sum(axis=1)[None, :]
+    return np.maximum(distances, 0.0)
+
+
+def _init_centroids(points, k, rng):
+    """k-means++ seeding: each new centroid is drawn proportionally to its squared distance from the chosen ones."""
+    centroids = [points[rng.integers(len(points))]]
+    closest = _squared_distances(points, centroids[0][None, :])[:, 0]
+    for _ in range(1, k):
+        total = closest.sum()
+        index = rng.choice(len(points), p=closest / total) if total > 0 else rng.integers(len(points))
+        centroids.append(points[index])
+        closest = np.minimum(closest, _squared_distances(points, points[index][None, :])[:, 0])
+    return np.array(centroids)
+
+
+def _assign_with_capacity(distances, capacity):
+    """Send each point to its nearest centroid that still has room; points closest to a centroid choose first."""
+    labels = np.empty(len(distances), dtype=int)
+    room = np.full(distances.shape[1], capacity)
+    preference = np.argsort(distances, axis=1, kind="stable")
+    for point in np.argsort(distances.min(axis=1), kind="stable"):
+        for cluster in preference[point]:
+            if room[cluster]:
+                labels[point] = cluster
+                room[cluster] -= 1
+                break
+    return labels
+
+
+def cluster_indices(vectors, target_size=5, max_size=8, n_components=32, n_iter=20, seed=0):
+    """
+    Group the rows of `vectors` (one embedding per node) into clusters of about
+    `target_size` similar nodes and never more than `max_size`.
+    Vectors are L2-normalized and reduced with PCA, seeded with k-means++ and
+    refined with Lloyd iterations whose assignment step respects the size cap.
+    Deterministic for a given `seed`. A level of at most `max_size` nodes is a
+    single cluster, so every level shrinks and the tree ends in one root.
+    Returns: [[row index]], members and clusters in their original order
+    """
+    if target_size < 2 or max_size < target_size:
+        raise ValueError("need 2 <= target_size <= max_size")
+    n = len(vectors)
+    if n <= max_size:
+        return [list(range(n))]
+
+    points = np.asarray(vectors, dtype=np.float64)
+    points = points / np.maximum(np.linalg.norm(points, axis=1, keepdims=True), 1e-12)
+    points = reduce_dimensions(points, n_components)
+
+    k = -(-n // target_size)
+    centroids = _init_centroids(points, k, np.random.default_rng(seed))
+    labels = None
+    for _ in range(n_iter):
+        new_labels = _assign_with_capacity(_squared_distances(points, centroids), max_size)
+        if labels is not None and np.array_equal(labels, new_labels):
+            break
+        labels = new_labels
+        for cluster in range(k):
+            members = points[labels == cluster]
+            if len(members):
+                centroids[cluster] = members.mean(axis=0)
+
+    # A one-node summary only paraphrases its child: fold singletons into the nearest cluster with room
+    sizes = np.bincount(labels, minlength=k)
+    for point in np.flatnonzero(sizes[labels] == 1):
+        if sizes[labels[point]] != 1:  # another singleton already joined it
+            continue
+        distances = _squared_distances(points[point][None, :], centroids)[0]
+        distances[(sizes == 0) | (sizes >= max_size) | (np.arange(k) == labels[point])] = np.inf
+        if np.isfinite(distances).any():
+            sizes[labels[point]] -= 1
+            labels[point] = int(np.argmin(distances))
+            sizes[labels[point]] += 1
+
+    clusters = [np.flatnonzero(labels == cluster).tolist() for cluster in range(k)]
+    return sorted((cluster for cluster in clusters if cluster), key=lambda cluster: cluster[0])
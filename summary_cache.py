@@ -0,0 +1,91 @@
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+
+
+class SummaryCache:
+    """
+    Persistent, content-addressed cache of LLM summaries.
+    Entries are keyed by a hash of (batch texts, level, model, prompt template),
+    so re-running the pipeline only sends batches whose inputs changed to the LLM.
+    The least recently used entries are evicted once `max_entries` is exceeded.
+    """
+
+    def __init__(self, path="essentials/summary_cache.sqlite3", max_entries=50000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS summaries ("
+            "key TEXT PRIMARY KEY, summary TEXT NOT NULL, level INTEGER, "
+            "created REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS summaries_last_used ON summaries(last_used)")
+        self._conn.commit()
+
+    @staticmethod
+    def key(texts, level, model, template):
+        payload = json.dumps([list(texts), level, model, template], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT summary FROM summaries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE summaries SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key, summary, level=None):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO summaries (key, summary, level, created, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, summary, level, now, now)
+            )
+            overflow = self._conn.execute("SELECT COUNT(*) FROM summaries").fetchone()[0] - self.max_entries
+            if overflow > 0:
+                self._conn.execute(
+                    "DELETE FROM summaries WHERE key IN "
+                    "(SELECT key FROM summaries ORDER BY last_used ASC LIMIT ?)",
+                    (overflow,)
+                )
+                self.evictions += overflow
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(summary)), 0) FROM summaries"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "summary_chars": size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions
+        }
+
+    def report(self):
+        stats = self.stats()
+        return (
+            f"📦 Summary cache: {stats['entries']}/{stats['max_entries']} entries, "
+            f"{stats['hits']} hits, {stats['misses']} misses "
+            f"({stats['hit_rate']:.0%} hit rate), {stats['evictions']} evicted"
+        )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,79 @@
+import os
+import sys
+import importlib
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from local_backends import HashingEmbedder  # noqa: E402
+from raptor_artifacts import ArtifactStore  # noqa: E402
+from vector_backends import MemmapBackend  # noqa: E402
+
+TOPICS = [
+    "cuff pressure calibration before a brachial measurement",
+    "pulse wave velocity between carotid and femoral sites",
+    "battery error codes and charging the device",
+    "printing and exporting a patient measurement report",
+    "cleaning and maintaining the tonometer probe",
+    "installing the server software and database",
+]
+
+
+def make_tree(files=2, chunks_per_file=12, batch_size=4):
+    """A small summary tree in summary_tree.json shape: level_0 chunks, level_1 summaries, one level_2 root."""
+    tree = {}
+    for f in range(files):
+        file_id = f"file_{f}"
+        level_0 = [
+            {"id": f"{file_id}_chunk_{i}_level_0", "source": [],
+             "text": f"Section {i} of manual {f}: {TOPICS[(i + f) % len(TOPICS)]}, step {i % 3}."}
+            for i in range(chunks_per_file)
+        ]
+        level_1 = [
+            {"id": f"{file_id}_summary_{b}_level_1", "source": [c["id"] for c in level_0[i:i + batch_size]],
+             "text": " ".join(c["text"] for c in level_0[i:i + batch_size])}
+            for b, i in enumerate(range(0, chunks_per_file, batch_size))
+        ]
+        level_2 = [{"id": f"{file_id}_summary_0_level_2", "source": [s["id"] for s in level_1],
+                    "text": f"Overview of manual {f}: " + ", ".join(TOPICS)}]
+        tree[file_id] = {"source": f"manual_{f}.pdf",
+                         "levels": {"level_0": level_0, "level_1": level_1, "level_2": level_2}}
+    return tree
+
+
+@pytest.fixture
+def embedder():
+    return HashingEmbedder(dim=64)
+
+
+@pytest.fixture
+def artifact_store(tmp_path):
+    store = ArtifactStore(str(tmp_path / "raptor.sqlite3"))
+    store.save_tree(make_tree())
+    yield store
+    store.close()
+
+
+@pytest.fixture
+def memmap_backend(tmp_path, embedder, artifact_store):
+    """MemmapBackend holding every node of the artifact store, embedded with the stub embedder."""
+    backend = MemmapBackend(embedder, str(tmp_path / "memmap"))
+    ids, texts, metadatas = [], [], []
+    for file_id, level_num, node in artifact_store.iter_nodes():
+        ids.append(node["id"])
+        texts.append(node["text"])
+        metadatas.append({"id": node["id"], "file_id": file_id, "level": level_num})
+    backend.build(ids, texts, metadatas)
+    return backend
+
+
+@pytest.fixture(scope="session")
+def query_llm(tmp_path_factory):
+    """7_query_llm imported from a scratch directory, since it opens its log file on import."""
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp("query_llm"))
+    try:
+        return importlib.import_module("7_query_llm")
+    finally:
+        os.chdir(cwd)
@@ -0,0 +1,45 @@
+import re
+
+import pytest
+
+from local_backends import StubChat
+
+SAMPLES = [
+    "### Summary\nThe cuff inflates.\n\nThe cuff inflates.\n  Then it deflates.  \n### Notes\nDone.",
+    "Line one\nLine one extended\nLine one\n\n\n   \nLine two",
+    "###\n##\n# heading\n#\nplain text with trailing spaces   \nplain text with trailing spaces",
+    "Short\nShort\nShorter\nShort and long\nShort",
+    "",
+]
+
+
+def batch_clean(answer):
+    """The original whole-answer cleanup AnswerCleaner must reproduce."""
+    cleaned, seen = [], set()
+    for line in answer.strip().split("\n"):
+        line = line.strip()
+        if line and line not in seen and not line.startswith("###"):
+            cleaned.append(line)
+            seen.add(line)
+    return "\n".join(cleaned)
+
+
+def stream_clean(query_llm, pieces):
+    cleaner = query_llm.AnswerCleaner()
+    return "".join(cleaner.feed(piece) for piece in pieces) + cleaner.finish()
+
+
+@pytest.mark.parametrize("answer", SAMPLES)
+def test_streamed_cleanup_matches_batch_cleanup(query_llm, answer):
+    expected = batch_clean(answer)
+    assert stream_clean(query_llm, [answer]) == expected
+    assert stream_clean(query_llm, list(answer)) == expected  # one character at a time
+    assert stream_clean(query_llm, re.findall(r"\s*\S+|\s+", answer)) == expected  # word tokens, like StubChat
+
+
+def test_stub_chat_stream_matches_batch_cleanup(query_llm):
+    chat = StubChat()
+    prompt = "Question:\nWhat is PWV?\n\nHierarchical Context\n[Chunk: a]\nFirst. Second.\n\n[Chunk: a]\nFirst. Second."
+    answer = chat(messages=[{"role": "user", "content": prompt}])["message"]["content"]
+    pieces = [chunk["message"]["content"] for chunk in chat(messages=[{"role": "user", "content": prompt}], stream=True)]
+    assert stream_clean(query_llm, pieces) == batch_clean(answer)
@@ -0,0 +1,54 @@
+import os
+
+import numpy as np
+
+from embedding_cache import EmbeddingCache
+
+
+def vectors(n, dim=4, offset=0):
+    return [[float(offset + i)] * dim for i in range(n)]
+
+
+def test_round_trip(tmp_path):
+    cache = EmbeddingCache("model", str(tmp_path))
+    cache.put_many(["a", "b"], vectors(2))
+    reopened = EmbeddingCache("model", str(tmp_path))
+    assert reopened.get_many(["b", "a", "c"]) == [vectors(2)[1], vectors(2)[0], None]
+
+
+def test_recover_drops_vector_rows_without_hashes(tmp_path):
+    cache = EmbeddingCache("model", str(tmp_path))
+    cache.put_many(["a", "b"], vectors(2))
+    with open(cache.vectors_path, "ab") as f:  # crash after the vectors, before the hashes
+        f.write(np.array(vectors(1, offset=9), dtype=np.float32).tobytes())
+
+    cache = EmbeddingCache("model", str(tmp_path))
+    assert len(cache) == 2
+    assert os.path.getsize(cache.vectors_path) == 2 * 4 * 4
+    cache.put_many(["c"], vectors(1, offset=5))
+    assert EmbeddingCache("model", str(tmp_path)).get_many(["a", "b", "c"]) == vectors(2) + vectors(1, offset=5)
+
+
+def test_recover_drops_half_written_hash_line(tmp_path):
+    cache = EmbeddingCache("model", str(tmp_path))
+    cache.put_many(["a", "b"], vectors(2))
+    with open(cache.vectors_path, "ab") as f:
+        f.write(np.array(vectors(1, offset=9), dtype=np.float32).tobytes())
+    with open(cache.hashes_path, "a") as f:
+        f.write(EmbeddingCache.text_hash("z")[:10])
+
+    cache = EmbeddingCache("model", str(tmp_path))
+    assert len(cache) == 2
+    cache.put_many(["c"], vectors(1, offset=5))
+    assert EmbeddingCache("model", str(tmp_path)).get_many(["c", "z"]) == [vectors(1, offset=5)[0], None]
+
+
+def test_recover_drops_hashes_without_vectors(tmp_path):
+    cache = EmbeddingCache("model", str(tmp_path))
+    cache.put_many(["a", "b"], vectors(2))
+    with open(cache.vectors_path, "r+b") as f:
+        f.truncate(1 * 4 * 4 + 3)  # second row cut short
+
+    cache = EmbeddingCache("model", str(tmp_path))
+    assert cache.get_many(["a", "b"]) == [vectors(2)[0], None]
+    assert os.path.getsize(cache.vectors_path) == 1 * 4 * 4
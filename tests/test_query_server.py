@@ -0,0 +1,67 @@
+import json
+import asyncio
+
+import pytest
+
+
+@pytest.fixture
+def server(query_llm):
+    import query_server
+    return query_server.QueryServer(max_pending=2)
+
+
+def dispatch(server, raw):
+    async def run():
+        reader = asyncio.StreamReader()
+        reader.feed_data(raw)
+        reader.feed_eof()
+        return await server._dispatch(reader)
+    return asyncio.run(run())
+
+
+def post(body, headers=None):
+    body = body if isinstance(body, bytes) else json.dumps(body).encode("utf-8")
+    headers = {"Content-Length": str(len(body)), **(headers or {})}
+    head = "".join(f"{name}: {value}\r\n" for name, value in headers.items())
+    return f"POST /query HTTP/1.1\r\n{head}\r\n".encode("latin-1") + body
+
+
+@pytest.mark.parametrize("raw", [
+    post([1, 2]),
+    post(b"{not json"),
+    post({}),
+    post({"question": 42}),
+    post({"question": "   "}),
+    post({"question": "What is PWV?", "top_k_root": "two"}),
+    post({"question": "What is PWV?", "top_k_children": 1.5}),
+    post({"question": "What is PWV?", "top_k_root": True}),
+    post({"question": "What is PWV?", "top_k_root": 0}),
+    post({"question": "What is PWV?", "show_sources": "yes"}),
+    post(b"{}", headers={"Content-Length": "abc"}),
+    post(b"{}", headers={"Content-Length": "-1"}),
+    b"GARBAGE\r\n\r\n",
+])
+def test_malformed_requests_get_400(server, raw):
+    status, payload, _ = dispatch(server, raw)
+    assert status == 400
+    assert "error" in payload
+
+
+def test_tree_parameters_rejected_in_collapsed_mode(server, query_llm, monkeypatch):
+    monkeypatch.setitem(query_llm.CONFIG, "retrieval_mode", "collapsed")
+    status, payload, _ = dispatch(server, post({"question": "What is PWV?", "top_k_root": 2}))
+    assert status == 400
+
+
+def test_busy_server_answers_503(server):
+    server.pending = server.max_pending
+    status, _, headers = dispatch(server, post({"question": "What is PWV?", "top_k_root": 2}))
+    assert status == 503
+    assert headers["Retry-After"] == "1"
+    assert server.rejected == 1
+
+
+def test_other_routes(server):
+    assert dispatch(server, b"GET /nowhere HTTP/1.1\r\n\r\n")[0] == 404
+    assert dispatch(server, b"GET /query HTTP/1.1\r\n\r\n")[0] == 405
+    assert dispatch(server, post(b"x" * 70000))[0] == 413
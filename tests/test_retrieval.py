@@ -0,0 +1,39 @@
+import pytest
+
+import r6_retrieval_mechs as retrieval
+
+QUESTIONS = [
+    "How do I calibrate the cuff pressure?",
+    "What is pulse wave velocity?",
+    "What does the battery error mean?",
+    "How do I print a report?",
+]
+
+
+@pytest.fixture
+def retriever(embedder, memmap_backend, artifact_store, monkeypatch):
+    retriever = retrieval.RaptorRetriever(memmap_backend, artifact_store)
+    retrieval.set_embeddings(embedder)
+    monkeypatch.setattr(retrieval, "_retriever", retriever)
+    yield retriever
+    retrieval.set_embeddings(None)
+
+
+def as_pairs(docs):
+    return [(doc.metadata["id"], doc.metadata["score"]) for doc in docs]
+
+
+@pytest.mark.parametrize("top_k_root,top_k_children", [(1, 2), (2, 3), (3, 1)])
+def test_batch_retrieval_matches_single_queries(retriever, top_k_root, top_k_children):
+    batch = retrieval.raptor_retrieve_batch(QUESTIONS, top_k_root=top_k_root, top_k_children=top_k_children)
+    single = [retrieval.raptor_retrieve(q, top_k_root=top_k_root, top_k_children=top_k_children) for q in QUESTIONS]
+    assert [as_pairs(docs) for docs in batch] == [as_pairs(docs) for docs in single]
+    assert all(docs for docs in batch)
+
+
+def test_hybrid_returns_no_more_chunks_than_tree(retriever):
+    for question in QUESTIONS:
+        tree = retriever.retrieve(question, 2, 3)
+        hybrid = retriever.retrieve_hybrid(question, 2, 3)
+        assert len(hybrid) == len(tree)
+        assert all("bm25_score" in doc.metadata for doc in hybrid)
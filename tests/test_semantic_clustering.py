@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+from semantic_clustering import cluster_indices
+
+
+@pytest.mark.parametrize("n", [1, 8, 9, 23, 64, 201])
+def test_clusters_partition_rows_within_size_cap(n):
+    vectors = np.random.default_rng(n).normal(size=(n, 16))
+    clusters = cluster_indices(vectors, target_size=5, max_size=8, n_components=8)
+    assert sorted(i for cluster in clusters for i in cluster) == list(range(n))
+    assert all(1 <= len(cluster) <= 8 for cluster in clusters)
+    if n > 8:
+        assert len(clusters) < n  # every level shrinks
+
+
+def test_tightly_grouped_rows_stay_together():
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(4, 16)) * 10
+    vectors = np.vstack([center + rng.normal(scale=0.01, size=(5, 16)) for center in centers])
+    clusters = cluster_indices(vectors, target_size=5, max_size=8)
+    assert sorted(map(sorted, clusters)) == [list(range(i, i + 5)) for i in range(0, 20, 5)]
+
+
+def test_deterministic_for_a_seed():
+    vectors = np.random.default_rng(1).normal(size=(40, 16))
+    assert cluster_indices(vectors, seed=3) == cluster_indices(vectors, seed=3)
+
+
+def test_rejects_inconsistent_sizes():
+    with pytest.raises(ValueError):
+        cluster_indices(np.zeros((10, 4)), target_size=6, max_size=5)
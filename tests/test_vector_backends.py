@@ -0,0 +1,83 @@
+import os
+
+import numpy as np
+
+from vector_backends import MemmapBackend
+
+
+def nodes(*numbers, level=0):
+    ids = [f"n{i}" for i in numbers]
+    return ids, [f"text about topic {i}" for i in numbers], [{"id": node_id, "level": level} for node_id in ids]
+
+
+def test_upsert_persist_round_trip(tmp_path, embedder):
+    writer = MemmapBackend(embedder, str(tmp_path))
+    writer.upsert(*nodes(0, 1, 2))
+    writer.persist()
+
+    reader = MemmapBackend(embedder, str(tmp_path))
+    stored = reader.get(include=["embeddings", "metadatas", "documents"])
+    assert stored["ids"] == ["n0", "n1", "n2"]
+    assert stored["documents"] == ["text about topic 0", "text about topic 1", "text about topic 2"]
+    expected = np.asarray(embedder.embed_documents(stored["documents"]), dtype=np.float32)
+    np.testing.assert_allclose(np.vstack(stored["embeddings"]), expected, atol=1e-6)
+    assert reader.search("text about topic 1", k=1)[0][0] == "n1"
+
+
+def test_upsert_replaces_existing_rows(tmp_path, embedder):
+    backend = MemmapBackend(embedder, str(tmp_path))
+    backend.upsert(*nodes(0, 1))
+    backend.persist()
+    backend.upsert(["n1"], ["completely different words"], [{"id": "n1", "level": 0, "edited": True}])
+    backend.persist()
+
+    reader = MemmapBackend(embedder, str(tmp_path))
+    stored = reader.get(ids=["n1"], include=["metadatas", "documents"])
+    assert stored == {"ids": ["n1"], "metadatas": [{"id": "n1", "level": 0, "edited": True}],
+                      "documents": ["completely different words"]}
+    assert len(reader.get()["ids"]) == 2
+
+
+def test_delete_and_readers_follow_persists(tmp_path, embedder):
+    writer = MemmapBackend(embedder, str(tmp_path))
+    reader = MemmapBackend(embedder, str(tmp_path))
+    writer.upsert(*nodes(0, 1, 2))
+    writer.persist()
+    assert reader.get()["ids"] == ["n0", "n1", "n2"]
+
+    writer.delete(["n1", "missing"])
+    writer.persist()
+    assert reader.get(include=["documents"]) == {"ids": ["n0", "n2"],
+                                                 "documents": ["text about topic 0", "text about topic 2"]}
+
+
+def test_rows_are_ordered_by_level_and_filters_apply(tmp_path, embedder):
+    backend = MemmapBackend(embedder, str(tmp_path))
+    backend.upsert(*nodes(0, 1, level=1))
+    backend.upsert(*nodes(2, 3, level=0))
+    backend.persist()
+    assert backend.get()["ids"] == ["n2", "n3", "n0", "n1"]
+    assert backend.get(where={"level": 1})["ids"] == ["n0", "n1"]
+    assert {node_id for node_id, _ in backend.search("topic", k=10, where={"level": {"$in": [0]}})} == {"n2", "n3"}
+    assert backend.shared_matrix(["n2", "n3"]) is not None
+    assert backend.shared_matrix(["n3", "n2"]) is None
+
+
+def test_persist_keeps_only_current_and_previous_generation(tmp_path, embedder):
+    backend = MemmapBackend(embedder, str(tmp_path))
+    for i in range(4):
+        backend.upsert(*nodes(i))
+        backend.persist()
+    files = sorted(name for name in os.listdir(tmp_path) if name != "index.json")
+    assert len([name for name in files if name.startswith("vectors-")]) == 2
+    assert len([name for name in files if name.startswith("documents-")]) == 2
+
+
+def test_readers_load_documents_only_when_asked(tmp_path, embedder):
+    writer = MemmapBackend(embedder, str(tmp_path))
+    writer.upsert(*nodes(0, 1))
+    writer.persist()
+    reader = MemmapBackend(embedder, str(tmp_path))
+    reader.get(include=["embeddings", "metadatas"])
+    assert reader.documents is None
+    assert reader.get(include=["documents"])["documents"] == ["text about topic 0", "text about topic 1"]
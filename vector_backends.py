@@ -0,0 +1,326 @@
+import os
+import json
+import time
+import threading
+import numpy as np
+
+# Which backend 5_embedding.py writes and r6_retrieval_mechs.py reads: "chroma" or "memmap"
+VECTOR_BACKEND = "chroma"
+CHROMA_DIR = "./chroma_store"
+MEMMAP_DIR = "./vectorstore/memmap"
+
+
+def _where_mask(metadatas, where):
+    """Rows matching a Chroma-style `where` filter ($eq, $ne, $in, $nin, $and, $or)."""
+    if not where:
+        return np.ones(len(metadatas), dtype=bool)
+    mask = np.ones(len(metadatas), dtype=bool)
+    for key, condition in where.items():
+        if key == "$and":
+            for clause in condition:
+                mask &= _where_mask(metadatas, clause)
+            continue
+        if key == "$or":
+            any_mask = np.zeros(len(metadatas), dtype=bool)
+            for clause in condition:
+                any_mask |= _where_mask(metadatas, clause)
+            mask &= any_mask
+            continue
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        values = [metadata.get(key) for metadata in metadatas]
+        for op, operand in condition.items():
+            if op == "$eq":
+                mask &= np.fromiter((value == operand for value in values), bool, len(values))
+            elif op == "$ne":
+                mask &= np.fromiter((value != operand for value in values), bool, len(values))
+            elif op in ("$in", "$nin"):
+                members = set(operand)
+                hit = np.fromiter((value in members for value in values), bool, len(values))
+                mask &= hit if op == "$in" else ~hit
+            else:
+                raise ValueError(f"unsupported filter operator {op}")
+    return mask
+
+
+class ChromaBackend:
+    """
+    The persistent Chroma collection behind the common backend interface.
+    Chroma ranks by squared L2 distance; embeddings are unit-normalized, so
+    scores are reported as the equivalent cosine similarity 1 - d/2.
+    """
+
+    name = "chroma"
+
+    def __init__(self, embedding_function, persist_directory=CHROMA_DIR):
+        from langchain_community.vectorstores import Chroma  # deferred so importing this module stays fast
+        self.embedding_function = embedding_function
+        self.persist_directory = persist_directory
+        self.store = Chroma(persist_directory=persist_directory, embedding_function=embedding_function)
+
+    def version(self):
+        """Newest modification time of the persisted collection, to notice writes by other processes."""
+        return max(
+            (os.stat(os.path.join(root, name)).st_mtime_ns
+             for root, _, names in os.walk(self.persist_directory) for name in names),
+            default=0
+        )
+
+    def get(self, ids=None, where=None, include=("metadatas",)):
+        return self.store.get(ids=ids, where=where, include=list(include))
+
+    def upsert(self, ids, texts, metadatas):
+        self.store.add_texts(texts=texts, metadatas=metadatas, ids=ids)
+
+    def delete(self, ids):
+        self.store.delete(ids=ids)
+
+    def build(self, ids, texts, metadatas, batch_size=64):
+        """Replace the whole collection with the given nodes."""
+        existing = self.get()["ids"]
+        if existing:
+            self.delete(existing)
+        for i in range(0, len(ids), batch_size):
+            self.upsert(ids[i:i + batch_size], texts[i:i + batch_size], metadatas[i:i + batch_size])
+        self.persist()
+
+    def search_by_vector(self, vector, k=4, where=None):
+        """Top-k (id, cosine score) pairs for a query vector, optionally filtered on metadata."""
+        results = self.store.similarity_search_by_vector_with_relevance_scores(vector, k=k, filter=where)
+        return [(doc.metadata.get("id"), 1.0 - distance / 2.0) for doc, distance in results]
+
+    def search(self, query, k=4, where=None):
+        return self.search_by_vector(self.embedding_function.embed_query(query), k=k, where=where)
+
+    def persist(self):
+        self.store.persist()
+
+
+class MemmapBackend:
+    """
+    Pure-NumPy vector index: a raw float32 matrix of unit-normalized rows
+    (`vectors-<generation>.f32`) opened read-only through a memory map, the
+    node texts (`documents-<generation>.json`), and `index.json` with the row
+    ids, metadata and the names of the current files. Every process that opens
+    the index shares the matrix through the page cache instead of holding a
+    private copy, and reads the texts only if get() asks for documents, so a
+    query worker holds just ids and metadata.
+
+    persist() writes the new generation's files, then atomically replaces
+    index.json to point at them, so readers never pair an index with the wrong
+    matrix. The previous generation is kept, so a reader that read the old
+    index.json but has not opened its files yet still finds them; older files
+    are removed. Rows are ordered by level, so the tree index can use each
+    level as a slice of the shared map. Readers reopen the files when they
+    change on disk. Writes are made in memory until persist().
+    """
+
+    name = "memmap"
+
+    def __init__(self, embedding_function, directory=MEMMAP_DIR):
+        self.embedding_function = embedding_function
+        self.directory = directory
+        self.index_path = os.path.join(directory, "index.json")
+        self._lock = threading.RLock()
+        self._loaded_mtime = None
+        self._dirty = False
+        self.vectors_file = None
+        self.documents_file = None
+        self.ids, self.metadatas, self.documents = [], [], []  # documents is None until first needed
+        self.row_of = {}
+        self.matrix = np.empty((0, 0), dtype=np.float32)
+        self._reload_if_changed()
+
+    def version(self):
+        """Modification time of index.json, which every persist() replaces."""
+        return os.stat(self.index_path).st_mtime_ns if os.path.exists(self.index_path) else 0
+
+    def _reload_if_changed(self):
+        for attempt in range(3):
+            if self._dirty or not os.path.exists(self.index_path):
+                return
+            mtime = os.stat(self.index_path).st_mtime_ns
+            if mtime == self._loaded_mtime:
+                return
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+            try:
+                matrix = (
+                    np.memmap(os.path.join(self.directory, index["vectors"]), dtype=np.float32, mode="r",
+                              shape=(len(index["ids"]), index["dim"]))
+                    if index["ids"] else np.empty((0, index["dim"]), dtype=np.float32)
+                )
+            except FileNotFoundError:
+                if attempt == 2:
+                    raise
+                continue  # two persists ran since index.json was read; reread it
+            self.ids, self.metadatas = index["ids"], index["metadatas"]
+            self.vectors_file = index["vectors"]
+            # Indexes written before the texts moved out kept them inline
+            self.documents_file = index.get("documents_file")
+            self.documents = None if self.documents_file else index.get("documents", [])
+            self.row_of = {node_id: row for row, node_id in enumerate(self.ids)}
+            self.matrix = matrix
+            self._loaded_mtime = mtime
+            return
+
+    def _load_documents(self):
+        if self.documents is not None:
+            return
+        try:
+            with open(os.path.join(self.directory, self.documents_file), "r", encoding="utf-8") as f:
+                self.documents = json.load(f)
+        except FileNotFoundError:
+            # Two persists ran since this generation was loaded; move to the current one
+            self._loaded_mtime = None
+            self._reload_if_changed()
+            self._load_documents()
+
+    def get(self, ids=None, where=None, include=("metadatas",)):
+        """Chroma-compatible get; embeddings are row views of the shared map, not copies."""
+        with self._lock:
+            self._reload_if_changed()
+            if ids is not None:
+                rows = [self.row_of[node_id] for node_id in ids if node_id in self.row_of]
+                mask = _where_mask([self.metadatas[row] for row in rows], where)
+                rows = [row for row, keep in zip(rows, mask) if keep]
+            else:
+                rows = np.flatnonzero(_where_mask(self.metadatas, where)).tolist()
+            result = {"ids": [self.ids[row] for row in rows]}
+            if "embeddings" in include:
+                result["embeddings"] = [self.matrix[row] for row in rows]
+            if "metadatas" in include:
+                result["metadatas"] = [self.metadatas[row] for row in rows]
+            if "documents" in include:
+                self._load_documents()
+                result["documents"] = [self.documents[row] for row in rows]
+            return result
+
+    def _writable(self):
+        if not self._dirty:
+            self._load_documents()
+            self.matrix = np.array(self.matrix)  # copy out of the read-only map
+            self._dirty = True
+
+    def upsert(self, ids, texts, metadatas):
+        if not ids:
+            return
+        vectors = np.asarray(self.embedding_function.embed_documents(texts), dtype=np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        with self._lock:
+            self._reload_if_changed()
+            self._writable()
+            if self.matrix.size == 0:
+                self.matrix = np.empty((0, vectors.shape[1]), dtype=np.float32)
+            stored, new_rows = len(self.matrix), []
+            for node_id, text, metadata, vector in zip(ids, texts, metadatas, vectors):
+                row = self.row_of.get(node_id)
+                if row is None:
+                    self.row_of[node_id] = len(self.ids)
+                    new_rows.append(vector)
+                    self.ids.append(node_id)
+                    self.metadatas.append(metadata)
+                    self.documents.append(text)
+                    continue
+                if row < stored:
+                    self.matrix[row] = vector
+                else:
+                    new_rows[row - stored] = vector
+                self.metadatas[row] = metadata
+                self.documents[row] = text
+            if new_rows:
+                self.matrix = np.vstack([self.matrix, np.vstack(new_rows)])
+
+    def delete(self, ids):
+        with self._lock:
+            self._reload_if_changed()
+            drop = {self.row_of[node_id] for node_id in ids if node_id in self.row_of}
+            if not drop:
+                return
+            self._writable()
+            keep = [row for row in range(len(self.ids)) if row not in drop]
+            self._take(keep)
+
+    def _take(self, rows):
+        self.matrix = self.matrix[rows]
+        self.ids = [self.ids[row] for row in rows]
+        self.metadatas = [self.metadatas[row] for row in rows]
+        self.documents = [self.documents[row] for row in rows]
+        self.row_of = {node_id: row for row, node_id in enumerate(self.ids)}
+
+    def build(self, ids, texts, metadatas, batch_size=64):
+        """Replace the whole index with the given nodes."""
+        with self._lock:
+            self._dirty = True
+            self.ids, self.metadatas, self.documents, self.row_of = [], [], [], {}
+            self.matrix = np.empty((0, 0), dtype=np.float32)
+            for i in range(0, len(ids), batch_size):
+                self.upsert(ids[i:i + batch_size], texts[i:i + batch_size], metadatas[i:i + batch_size])
+            self.persist()
+
+    def search_by_vector(self, vector, k=4, where=None):
+        """Top-k (id, cosine score) pairs for a query vector, optionally filtered on metadata."""
+        with self._lock:
+            self._reload_if_changed()
+            rows = np.flatnonzero(_where_mask(self.metadatas, where))
+            if not len(rows) or k <= 0:
+                return []
+            query = np.asarray(vector, dtype=np.float32)
+            query = query / (np.linalg.norm(query) or 1.0)
+            scores = self.matrix[rows] @ query if where else self.matrix @ query
+            k = min(k, len(rows))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top], kind="stable")]
+            return [(self.ids[rows[i]], float(scores[i])) for i in top]
+
+    def search(self, query, k=4, where=None):
+        return self.search_by_vector(self.embedding_function.embed_query(query), k=k, where=where)
+
+    def shared_matrix(self, ids):
+        """The mapped rows of `ids` as a zero-copy slice if they are stored contiguously in that order, else None."""
+        with self._lock:
+            if self._dirty or not ids or any(node_id not in self.row_of for node_id in ids):
+                return None
+            start = self.row_of[ids[0]]
+            if any(self.row_of[node_id] != start + i for i, node_id in enumerate(ids)):
+                return None
+            return self.matrix[start:start + len(ids)]
+
+    def persist(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            # Order rows by level (stable within a level) so each level is one contiguous slice
+            self._take(sorted(range(len(self.ids)), key=lambda row: self.metadatas[row].get("level", 0)))
+            os.makedirs(self.directory, exist_ok=True)
+            dim = self.matrix.shape[1] if self.matrix.ndim == 2 else 0
+            keep = {self.vectors_file, self.documents_file}
+            generation = time.time_ns()
+            self.vectors_file, self.documents_file = f"vectors-{generation}.f32", f"documents-{generation}.json"
+            keep |= {self.vectors_file, self.documents_file}
+            np.ascontiguousarray(self.matrix, dtype=np.float32).tofile(os.path.join(self.directory, self.vectors_file))
+            with open(os.path.join(self.directory, self.documents_file), "w", encoding="utf-8") as f:
+                json.dump(self.documents, f, ensure_ascii=False)
+            with open(self.index_path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump({"dim": dim, "vectors": self.vectors_file, "documents_file": self.documents_file,
+                           "ids": self.ids, "metadatas": self.metadatas}, f, ensure_ascii=False)
+            os.replace(self.index_path + ".tmp", self.index_path)
+            # Only now is the new generation visible; keep the previous one for readers that are
+            # between reading the old index.json and opening its files. Open maps survive unlinking.
+            for name in os.listdir(self.directory):
+                if name.startswith(("vectors-", "documents-")) and name not in keep:
+                    os.remove(os.path.join(self.directory, name))
+            self._dirty = False
+            self._loaded_mtime = None
+            self._reload_if_changed()
+
+
+BACKENDS = {"chroma": ChromaBackend, "memmap": MemmapBackend}
+
+
+def open_backend(embedding_function, name=None):
+    """Open the configured vector backend (VECTOR_BACKEND unless `name` is given)."""
+    name = name or VECTOR_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"unknown vector backend {name!r}; expected one of {sorted(BACKENDS)}")
+    return BACKENDS[name](embedding_function)